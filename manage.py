@@ -150,6 +150,8 @@ def init():
     # Set up custom functions, triggers and views in postgres
     psql('./plenario/dbscripts/sensor_tree.sql')
     psql('./plenario/dbscripts/point_from_location.sql')
+    # MetaTable maps these columns, so init must not go on without them.
+    psql('./plenario/dbscripts/meta_master_source.sql', stop_on_error=True)
 
     # Set up the default user if we are running in anything but production
     if os.environ.get('CONFIG') != 'prod':
@@ -0,0 +1,300 @@
+"""Response caching for the API views.
+
+TieredRedisCache is the cache backend. It keeps a small, short lived LRU of
+recently used entries in each process in front of redis, which saves the
+round trip for hot responses. Entries above a size threshold are compressed
+before they go to redis, and entries too large to be worth caching are not
+stored at all, so that a few multi-megabyte responses cannot push everything
+else out.
+
+SingleFlightCache is a drop in replacement for Flask-Cache's Cache whose
+cached views compute a missing entry only once at a time. When many
+identical requests miss at once, the first to take a short lock on the cache
+key runs the view and stores the response, the others poll the cache for it
+instead of running the same query alongside. Waiting is bounded by
+CACHE_FLIGHT_TIMEOUT, after which a waiter runs the view itself. Responses
+marked Cache-Control: no-store, like job tickets, are never stored.
+"""
+
+import functools
+import logging
+import pickle
+import threading
+import zlib
+from collections import OrderedDict
+from time import monotonic, sleep
+from uuid import uuid4
+
+from flask import current_app, request
+from flask_cache import Cache
+from werkzeug.contrib.cache import RedisCache
+
+from plenario.settings import CACHE_FLIGHT_TIMEOUT
+
+
+logger = logging.getLogger(__name__)
+
+# Bounds, in seconds, on how long a waiting request sleeps between looks at
+# the cache. The interval doubles from the first to the second.
+FLIGHT_POLL_MIN = 0.02
+FLIGHT_POLL_MAX = 0.5
+
+
+class TieredRedisCache(RedisCache):
+    """RedisCache with an in-process LRU in front of it and compression of
+    large entries.
+
+    The LRU holds serialized entries rather than the objects themselves, so
+    every hit gets its own copy of a response to modify. It is bounded by
+    local_items entries of at most local_max_size bytes each, and entries
+    expire from it after local_ttl seconds, which bounds how long a process
+    can go on serving an entry that was replaced or deleted by another.
+
+    :param local_items: most entries kept in the process
+    :param local_ttl: seconds an entry is kept in the process
+    :param local_max_size: largest serialized entry kept in the process
+    :param compress_min_size: smallest serialized entry that is compressed
+    :param max_size: largest serialized entry that is cached at all
+    """
+
+    def __init__(self, local_items=256, local_ttl=5, local_max_size=64 * 1024,
+                 compress_min_size=16 * 1024, max_size=2 * 1024 * 1024, **kwargs):
+        super(TieredRedisCache, self).__init__(**kwargs)
+        self.local_items = local_items
+        self.local_ttl = local_ttl
+        self.local_max_size = local_max_size
+        self.compress_min_size = compress_min_size
+        self.max_size = max_size
+        self._local = OrderedDict()
+        self._local_lock = threading.Lock()
+
+    def dump_object(self, value):
+        dump = super(TieredRedisCache, self).dump_object(value)
+        if dump.startswith(b'!') and len(dump) >= self.compress_min_size:
+            return b'z' + zlib.compress(dump[1:])
+        return dump
+
+    def load_object(self, value):
+        if value is not None and value.startswith(b'z'):
+            try:
+                return pickle.loads(zlib.decompress(value[1:]))
+            except (zlib.error, pickle.PickleError):
+                return None
+        return super(TieredRedisCache, self).load_object(value)
+
+    def _local_get(self, key):
+        with self._local_lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires, dump = entry
+            if expires < monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return dump
+
+    def _local_set(self, key, dump):
+        with self._local_lock:
+            self._local.pop(key, None)
+            if len(dump) > self.local_max_size:
+                return
+            self._local[key] = monotonic() + self.local_ttl, dump
+            while len(self._local) > self.local_items:
+                self._local.popitem(last=False)
+
+    def _local_discard(self, *keys):
+        with self._local_lock:
+            for key in keys:
+                self._local.pop(key, None)
+
+    def get(self, key):
+        dump = self._local_get(key)
+        if dump is None:
+            dump = self._client.get(self.key_prefix + key)
+            if dump is None:
+                return None
+            self._local_set(key, dump)
+        return self.load_object(dump)
+
+    def set(self, key, value, timeout=None):
+        timeout = self._normalize_timeout(timeout)
+        dump = self.dump_object(value)
+        if len(dump) > self.max_size:
+            logger.info('Not caching {}, {} bytes is over the limit.'.format(key, len(dump)))
+            self.delete(key)
+            return False
+
+        self._local_set(key, dump)
+        if timeout == -1:
+            return self._client.set(name=self.key_prefix + key, value=dump)
+        return self._client.setex(name=self.key_prefix + key, value=dump, time=timeout)
+
+    def set_many(self, mapping, timeout=None):
+        return all(self.set(key, value, timeout) for key, value in mapping.items())
+
+    def add(self, key, value, timeout=None):
+        self._local_discard(key)
+        return super(TieredRedisCache, self).add(key, value, timeout)
+
+    def delete(self, key):
+        self._local_discard(key)
+        return super(TieredRedisCache, self).delete(key)
+
+    def delete_many(self, *keys):
+        self._local_discard(*keys)
+        return super(TieredRedisCache, self).delete_many(*keys)
+
+    def clear(self):
+        with self._local_lock:
+            self._local.clear()
+        return super(TieredRedisCache, self).clear()
+
+
+def tiered_redis(app, config, args, kwargs):
+    """Flask-Cache backend factory for TieredRedisCache, configured like the
+    built in redis backend plus the CACHE_LOCAL_* and CACHE_*_SIZE options."""
+    kwargs.update(
+        host=config.get('CACHE_REDIS_HOST', 'localhost'),
+        port=config.get('CACHE_REDIS_PORT', 6379),
+        local_items=config.get('CACHE_LOCAL_ITEMS', 256),
+        local_ttl=config.get('CACHE_LOCAL_TTL', 5),
+        local_max_size=config.get('CACHE_LOCAL_MAX_SIZE', 64 * 1024),
+        compress_min_size=config.get('CACHE_COMPRESS_MIN_SIZE', 16 * 1024),
+        max_size=config.get('CACHE_MAX_SIZE', 2 * 1024 * 1024)
+    )
+    if config.get('CACHE_REDIS_PASSWORD'):
+        kwargs['password'] = config['CACHE_REDIS_PASSWORD']
+    if config.get('CACHE_KEY_PREFIX'):
+        kwargs['key_prefix'] = config['CACHE_KEY_PREFIX']
+    return TieredRedisCache(*args, **kwargs)
+
+
+class SingleFlightCache(Cache):
+
+    def cached(self, timeout=None, key_prefix='view/%s', unless=None):
+        """Decorator for views, with the same arguments as Cache.cached."""
+
+        def decorator(f):
+            @functools.wraps(f)
+            def decorated_function(*args, **kwargs):
+                # Bypass the cache entirely.
+                if callable(unless) and unless() is True:
+                    return f(*args, **kwargs)
+
+                try:
+                    cache_key = decorated_function.make_cache_key(*args, **kwargs)
+                    rv = self.cache.get(cache_key)
+                except Exception:
+                    if current_app.debug:
+                        raise
+                    logger.exception('Exception possibly due to cache backend.')
+                    return f(*args, **kwargs)
+
+                if rv is None:
+                    rv = self._compute_once(cache_key, decorated_function.cache_timeout, f, args, kwargs)
+                return rv
+
+            def make_cache_key(*args, **kwargs):
+                if callable(key_prefix):
+                    return key_prefix()
+                elif '%s' in key_prefix:
+                    return key_prefix % request.path
+                return key_prefix
+
+            decorated_function.uncached = f
+            decorated_function.cache_timeout = timeout
+            decorated_function.make_cache_key = make_cache_key
+
+            return decorated_function
+        return decorator
+
+    def _compute_once(self, cache_key, timeout, f, args, kwargs):
+        """Run a view for a missing cache entry, unless another request is
+        already running it, in which case wait for its response to be cached.
+        If that request finishes without caching its response (because it is
+        too large, marked no-store, or the view failed), the waiters run the
+        view themselves at once rather than taking turns at the lock.
+        """
+        lock_key = 'flight_' + cache_key
+        token = uuid4().hex
+        deadline = monotonic() + CACHE_FLIGHT_TIMEOUT
+        interval = FLIGHT_POLL_MIN
+
+        try:
+            leader = self._acquire(lock_key, token)
+        except Exception:
+            logger.exception('Exception possibly due to cache backend.')
+            return f(*args, **kwargs)
+
+        if leader:
+            try:
+                rv = f(*args, **kwargs)
+                self._store(cache_key, rv, timeout)
+                return rv
+            finally:
+                self._release(lock_key, token)
+
+        while True:
+            sleep(interval)
+            interval = min(interval * 2, FLIGHT_POLL_MAX)
+
+            # Look at the lock before the entry, so that a response cached
+            # just before the lock was released is not missed.
+            try:
+                released = not self._locked(lock_key)
+                rv = self.cache.get(cache_key)
+            except Exception:
+                logger.exception('Exception possibly due to cache backend.')
+                return f(*args, **kwargs)
+            if rv is not None:
+                return rv
+
+            if released:
+                return f(*args, **kwargs)
+
+            if monotonic() >= deadline:
+                logger.warning('Gave up waiting for {} to be cached.'.format(cache_key))
+                return f(*args, **kwargs)
+
+    def _acquire(self, lock_key, token):
+        client = getattr(self.cache, '_client', None)
+        if client is None:
+            return self.cache.add(lock_key, token, timeout=CACHE_FLIGHT_TIMEOUT)
+        # A single SET NX EX. Werkzeug's add is SETNX followed by EXPIRE, and
+        # a process dying between the two would leave a lock that never
+        # expires.
+        key = self.cache.key_prefix + lock_key
+        return bool(client.set(key, token, nx=True, ex=CACHE_FLIGHT_TIMEOUT))
+
+    def _locked(self, lock_key):
+        client = getattr(self.cache, '_client', None)
+        if client is None:
+            return self.cache.get(lock_key) is not None
+        return bool(client.exists(self.cache.key_prefix + lock_key))
+
+    def _store(self, cache_key, rv, timeout):
+        cache_control = getattr(rv, 'cache_control', None)
+        if cache_control is not None and cache_control.no_store:
+            return
+        try:
+            self.cache.set(cache_key, rv, timeout=timeout)
+        except Exception:
+            if current_app.debug:
+                raise
+            logger.exception('Exception possibly due to cache backend.')
+
+    def _release(self, lock_key, token):
+        # Only drop the lock if it is still ours, it may have timed out and
+        # been taken by another request in the meantime.
+        try:
+            client = getattr(self.cache, '_client', None)
+            if client is None:
+                if self.cache.get(lock_key) == token:
+                    self.cache.delete(lock_key)
+            else:
+                key = self.cache.key_prefix + lock_key
+                if client.get(key) == token.encode('ascii'):
+                    client.delete(key)
+        except Exception:
+            logger.exception('Exception possibly due to cache backend.')
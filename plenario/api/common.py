@@ -1,23 +1,30 @@
+import base64
 import csv
 import json
 import logging
 from datetime import date, datetime, time, timedelta
 from functools import update_wrapper
+from hashlib import md5
 from io import StringIO
 
+from dateutil import parser
 from flask import current_app, make_response, request
-from flask_cache import Cache
+from marshmallow.fields import Boolean
+from marshmallow.utils import missing
 from shapely.geometry import asShape
 from sqlalchemy.sql.schema import Table
 
+from plenario.api.caching import SingleFlightCache
+from plenario.api.condition_builder import normalize_tree
 from plenario.models import MetaTable
 from plenario.settings import CACHE_CONFIG
+from plenario.utils.cache_versions import CATALOG, dataset_versions
 from plenario.utils.helpers import get_size_in_degrees
 
 
 logger = logging.getLogger(__name__)
 
-cache = Cache(config=CACHE_CONFIG)
+cache = SingleFlightCache(config=CACHE_CONFIG)
 
 RESPONSE_LIMIT = 1000
 CACHE_TIMEOUT = 60 * 60 * 6
@@ -103,10 +110,177 @@ def crossdomain(origin=None, methods=None, headers=None,
     return decorator
 
 
+# Arguments whose values are normalized before they become part of a cache key.
+GEOMETRY_ARGS = {'location_geom__within', 'geom'}
+DATE_ARGS = {'obs_date__ge', 'obs_date__le', 'start_datetime', 'end_datetime'}
+LIST_ARGS = {'dataset_name__in'}
+
+
+def _canonical_value(key, value, booleans=frozenset()):
+    """Reduce a single query string value to a canonical string, so that two
+    spellings of the same argument (whitespace in a geojson document, the
+    order of keys in a filter tree, the format of a date, the case of a
+    boolean flag) look the same.
+
+    Values that fail to normalize, and free-form values, are left as they
+    are. Any two values that reduce to the same string must be treated the
+    same way by the validators, since they share a cached response.
+
+    :param booleans: names of the arguments whose schema field is a Boolean
+    """
+    try:
+        if key in GEOMETRY_ARGS:
+            fragment = extract_first_geometry_fragment(value)
+            return json.dumps(fragment, sort_keys=True, separators=(',', ':'))
+        elif key in DATE_ARGS:
+            return parser.parse(value).isoformat()
+        elif key in LIST_ARGS:
+            return ','.join(sorted(value.split(',')))
+        elif key.endswith('filter'):
+            tree = normalize_tree(json.loads(value))
+            return json.dumps(tree, sort_keys=True, separators=(',', ':'))
+    except (AttributeError, TypeError, ValueError, OverflowError, KeyError, IndexError):
+        pass
+
+    if isinstance(value, bool):
+        return str(value).lower()
+    if key in booleans and value.lower() in {'true', 'false'}:
+        return value.lower()
+    return value
+
+
+def boolean_args(schema):
+    """Collect the names of the arguments a marshmallow schema reads as
+    booleans, whose values are matched regardless of case.
+
+    :param schema: marshmallow Schema class
+    :returns: set of argument names
+    """
+    return {name for name, field in schema._declared_fields.items() if isinstance(field, Boolean)}
+
+
+def schema_defaults(schema):
+    """Collect the static default values of a marshmallow schema's fields,
+    formatted the way they would arrive in a query string. Defaults that are
+    computed at request time (like 'the last 90 days') are left out, since
+    they are not the same from one request to the next.
+
+    :param schema: marshmallow Schema class
+    :returns: dictionary of argument names to default strings
+    """
+    defaults = {}
+    for name, field in schema._declared_fields.items():
+        default = field.missing if field.missing is not missing else field.default
+        if default is missing or default is None or callable(default):
+            continue
+        if isinstance(default, (date, datetime, time)):
+            continue
+        defaults[name] = _canonical_value(name, default if isinstance(default, bool) else str(default))
+    return defaults
+
+
+def query_fingerprint(args, defaults=None, booleans=frozenset()):
+    """Make a stable digest of a set of query arguments. Unlike the builtin
+    hash, the digest does not change between processes, so every worker (and
+    every host) computes the same value for the same query.
+
+    :param args: request arguments, either a MultiDict or a plain dict
+    :param defaults: values to assume for arguments that were not provided
+    :param booleans: names of the arguments whose values are booleans
+    :returns: hex digest string
+    """
+    canonical = {k: [v] for k, v in (defaults or {}).items()}
+    for key in args:
+        values = args.getlist(key) if hasattr(args, 'getlist') else [args[key]]
+        canonical[key] = sorted(_canonical_value(key, v, booleans) for v in values)
+
+    serialized = json.dumps(sorted(canonical.items()), separators=(',', ':'))
+    return md5(serialized.encode('utf-8')).hexdigest()
+
+
 def make_cache_key(*args, **kwargs):
-    path = request.path
-    args = str(hash(frozenset(list(request.args.items()))))
-    return path + args
+    return request.path + '?' + query_fingerprint(request.args)
+
+
+def referenced_datasets(args):
+    """Pick out the names of the point datasets and shapesets that a set of
+    query arguments draws on.
+
+    :param args: request arguments
+    :returns: set of dataset names, empty if the query names none
+    """
+    names = set()
+    for key in args:
+        if key in {'dataset_name', 'shape'}:
+            names.add(args[key].strip())
+        elif key == 'dataset_name__in':
+            names.update(v.strip() for v in args[key].split(','))
+        elif key.endswith('__filter'):
+            names.add(key[:-len('__filter')])
+    names.discard('')
+    return names
+
+
+def make_validated_cache_key(schema, versioned=True):
+    """Build a cache key function for an endpoint whose arguments are checked
+    by the given schema. Leaving out an argument and passing its default value
+    explicitly produce the same key.
+
+    If versioned, the key also carries the version stamp of every dataset the
+    query touches (or of the whole catalog, for queries that name none), so
+    that refreshing a dataset retires exactly the responses built from it.
+
+    :param schema: marshmallow Schema class used to validate the endpoint
+    :param versioned: include dataset version stamps in the key
+    :returns: function that can be passed as a key_prefix to cache.cached
+    """
+    defaults = schema_defaults(schema)
+    booleans = boolean_args(schema)
+
+    def validated_cache_key(*args, **kwargs):
+        key = request.path + '?' + query_fingerprint(request.args, defaults, booleans)
+        if versioned:
+            names = referenced_datasets(request.args) or {CATALOG}
+            key += '@' + ','.join('{}:{}'.format(*v) for v in dataset_versions(names))
+        return key
+
+    return validated_cache_key
+
+
+def encode_cursor(point_date, hash_):
+    """Make an opaque pagination token that points at a single row of a point
+    dataset. Rows are paged in (point_date, hash) order, so together the two
+    values are enough to seek to the row that comes after this one.
+
+    :param point_date: point_date of the last row on the current page
+    :param hash_: hash of the last row on the current page
+    :returns: url safe string
+    """
+    if point_date is not None:
+        point_date = point_date.isoformat()
+    token = json.dumps([point_date, hash_])
+    return base64.urlsafe_b64encode(token.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Unpack a token made by encode_cursor.
+
+    :param cursor: url safe string
+    :returns: (point_date, hash) tuple
+    :raises: ValueError if the token was not made by encode_cursor
+    """
+    try:
+        token = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        point_date, hash_ = json.loads(token)
+        if point_date is not None:
+            point_date = parser.parse(point_date)
+    except (AttributeError, TypeError, ValueError, OverflowError):
+        raise ValueError('Invalid cursor: {}'.format(cursor))
+
+    if not isinstance(hash_, str):
+        raise ValueError('Invalid cursor: {}'.format(cursor))
+
+    return point_date, hash_
 
 
 def make_csv(data):
@@ -1,6 +1,9 @@
+import json
 import re
+from collections import OrderedDict
+from weakref import WeakKeyDictionary
 
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, bindparam, or_
 
 # field_ops
 # =========
@@ -20,6 +23,14 @@ field_ops = {
     'in': 'in'
 }
 
+# Condition templates for each table, keyed by the shape of the tree they were
+# built from. Tables are held weakly so that a table replaced by a fresh
+# reflection takes its templates with it.
+_templates = WeakKeyDictionary()
+
+# Most templates kept for a single table before they are all thrown out.
+MAX_TEMPLATES = 512
+
 
 def parse_tree(table, condition_tree, literally=False):
     """Parse nested conditions provided as a dict for a single table. Wraps
@@ -31,12 +42,186 @@ def parse_tree(table, condition_tree, literally=False):
     :returns SQLAlchemy conditions for querying the table with
     """
     try:
-        return _parse_condition_tree(table, condition_tree, literally)
+        if literally:
+            return _parse_condition_tree(table, condition_tree, literally)
+        condition_tree = normalize_tree(condition_tree)
+        if condition_tree is None:
+            return and_()
+        return _parse_from_template(table, condition_tree)
     except Exception as ex:
         raise ValueError('{} caused parse to fail for table {} with args {}'
                          .format(ex, table, condition_tree))
 
 
+def normalize_tree(ctree):
+    """Rewrite a condition tree into a canonical form that is cheaper to
+    evaluate, so that equivalent trees build the same conditions and share
+    cached results. Nested ands and ors are flattened, a ge and le pair on
+    one column under an and becomes a between, eqs and ins on one column
+    under an or become a single in, duplicate and empty nodes are dropped and
+    children are sorted.
+
+    :param ctree: dictionary of conditions created from JSON
+    :returns: the normalized tree, or None if nothing is left of it
+    """
+    op = ctree['op']
+
+    if op not in ('and', 'or'):
+        if op == 'in' and isinstance(ctree['val'], str):
+            return {'op': 'in', 'col': ctree['col'], 'val': ctree['val'].split(',')}
+        return dict(ctree)
+
+    children = []
+    for child in ctree['val']:
+        child = normalize_tree(child)
+        if child is None:
+            # Empty nodes are left out, as sqlalchemy leaves out an empty
+            # and_() or or_(), under an or as well as under an and.
+            continue
+        if child['op'] == op:
+            children.extend(child['val'])
+        else:
+            children.append(child)
+
+    if op == 'and':
+        children = _merge_ranges(children)
+    else:
+        children = _merge_equalities(children)
+
+    children = list(OrderedDict((_tree_key(child), child) for child in children).values())
+    children.sort(key=_tree_key)
+
+    if not children:
+        return None
+    if len(children) == 1:
+        return children[0]
+    return {'op': op, 'val': children}
+
+
+def _tree_key(ctree):
+    return json.dumps(ctree, sort_keys=True, default=str)
+
+
+def _by_column(children, ops):
+    """Group the leaves among children that compare a named column using one
+    of ops, keyed by column name."""
+    groups = OrderedDict()
+    for child in children:
+        if child['op'] in ops and isinstance(child.get('col'), str) and child['val'] is not None:
+            groups.setdefault(child['col'], []).append(child)
+    return groups
+
+
+def _merge_ranges(children):
+    """Replace a single ge and le on the same column with a between."""
+    for col, leaves in _by_column(children, {'ge', 'le'}).items():
+        ops = sorted(leaf['op'] for leaf in leaves)
+        if ops != ['ge', 'le']:
+            continue
+        lower, upper = sorted(leaves, key=lambda leaf: leaf['op'])
+        children = [child for child in children if child not in leaves]
+        children.append({'op': 'between', 'col': col, 'val': [lower['val'], upper['val']]})
+    return children
+
+
+def _merge_equalities(children):
+    """Replace the eqs and ins on the same column with a single in."""
+    for col, leaves in _by_column(children, {'eq', 'in'}).items():
+        if len(leaves) < 2:
+            continue
+        values = []
+        for leaf in leaves:
+            values.extend(leaf['val'] if leaf['op'] == 'in' else [leaf['val']])
+        values = sorted(OrderedDict((str(v), v) for v in values).values(), key=str)
+        children = [child for child in children if child not in leaves]
+        children.append({'op': 'in', 'col': col, 'val': values})
+    return children
+
+
+def _parse_from_template(table, ctree):
+    """Build the conditions for a tree from a cached template for trees of
+    the same shape, filling in this tree's values as bind parameters. Trees
+    that can't be expressed with bind parameters are parsed directly.
+
+    :param table: table object whose columns are being used in the conditions
+    :param ctree: dictionary of conditions created from JSON
+    :returns SQLAlchemy conditions for querying the table with
+    """
+    values = []
+    signature = _tree_signature(table, ctree, values)
+    if signature is None:
+        return _parse_condition_tree(table, ctree)
+
+    templates = _templates.setdefault(table, {})
+    try:
+        template, keys = templates[signature]
+    except KeyError:
+        binds = []
+        template = _build_template(table, signature, binds)
+        keys = [b.key for b in binds]
+        if len(templates) >= MAX_TEMPLATES:
+            templates.clear()
+        templates[signature] = template, keys
+
+    return template.params(dict(zip(keys, values)))
+
+
+def _tree_signature(table, ctree, values):
+    """Describe the shape of a condition tree (its operators, columns and
+    nesting) while collecting its values, in order, into values.
+
+    :returns: hashable signature, or None if the tree can't be templated
+    """
+    op = ctree['op']
+
+    if op in ('and', 'or'):
+        children = tuple(_tree_signature(table, child, values) for child in ctree['val'])
+        if None in children:
+            return None
+        return op, children
+
+    col, val = ctree['col'], ctree['val']
+    # Comparisons with NULL, IS and IS NOT need the value in the SQL itself,
+    # and column-like objects such as date__time_of_day have no name to key on.
+    if op not in field_ops and op != 'between' or op in ('is', 'isnot') or val is None \
+            or not isinstance(col, str) or col not in table.columns:
+        return None
+
+    if op == 'in':
+        items = val.split(',') if isinstance(val, str) else list(val)
+        values.extend(items)
+        return op, col, len(items)
+
+    if op == 'between':
+        values.extend(val)
+        return op, col
+
+    values.append(val)
+    return op, col
+
+
+def _build_template(table, signature, binds):
+    """Build the conditions for a tree signature with a bind parameter in
+    place of every value, collecting the parameters, in order, into binds."""
+    op = signature[0]
+
+    if op == 'and':
+        return and_(*[_build_template(table, child, binds) for child in signature[1]])
+
+    elif op == 'or':
+        return or_(*[_build_template(table, child, binds) for child in signature[1]])
+
+    col = signature[1]
+    if op in ('in', 'between'):
+        count = signature[2] if op == 'in' else 2
+        operand = [bindparam(col, unique=True) for _ in range(count)]
+        binds.extend(operand)
+    else:
+        operand = bindparam(col, unique=True)
+        binds.append(operand)
+    return _operator_to_condition(table.columns[col], op, operand)
+
+
 def _parse_condition_tree(table, ctree, literally=False):
     """Parse nested conditions provided as a dict for a single table.
 
@@ -58,7 +243,7 @@ def _parse_condition_tree(table, ctree, literally=False):
             for child in ctree['val']
         )
 
-    elif op in field_ops:
+    elif op in field_ops or op == 'between':
         col = ctree['col']
         val = ctree['val']
         try:
@@ -70,6 +255,8 @@ def _parse_condition_tree(table, ctree, literally=False):
         # that could specify a column, but rather as a column-like object
         # itself.
         except KeyError:
+            if op == 'between':
+                return col.between(*val)
             return getattr(col, field_ops[op])(val)
 
 
@@ -84,7 +271,11 @@ def _operator_to_condition(column, operator, operand, literally=False):
     :returns: SQLAlchemy condition or string
     """
     if operator == 'in':
-        condition = column.in_(operand.split(','))
+        if isinstance(operand, str):
+            operand = operand.split(',')
+        condition = column.in_(operand)
+    elif operator == 'between':
+        condition = column.between(*operand)
     elif operator == 'eq':
         condition = column == operand
     else:
@@ -1,21 +1,257 @@
-import pickle
+"""Background execution of API requests made with job=true.
 
-from flask import jsonify
+The web server hands the request, minus the job flag, to a celery worker and
+answers at once with a ticket. The worker runs the request through the same
+route logic as the synchronous API and writes the response body to JOBS_DIR
+as a series of gzipped pages, split on line boundaries where possible.
+/jobs/<ticket> reports the job's status and, once it has finished, serves
+the pages one at a time with ?page=N.
 
-from plenario.database import postgres_base, postgres_engine as engine
-from plenario.utils.helpers import reflect
+Requests that the planner expects to be too expensive to run inline can be
+turned into jobs the same way, see check_query_cost.
+"""
+
+import gzip
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from urllib.parse import urlencode
+
+from flask import Response, current_app, jsonify, request, url_for
+
+from plenario.database import explain_cost
+from plenario.settings import JOBS_DIR, JOB_PAGE_SIZE, JOB_TTL
+
+
+class QueryCostExceeded(Exception):
+    """Raised for a statement whose estimated cost is over QUERY_COST_LIMIT."""
+
+    def __init__(self, cost, rows):
+        super(QueryCostExceeded, self).__init__(
+            'Estimated query cost is {:.0f} for about {:.0f} rows'.format(cost, rows)
+        )
+        self.cost = cost
+        self.rows = rows
+
+
+def _job_dir(ticket):
+    # Tickets are generated by make_job_response, anything else is unknown
+    # and must not be used to build a path.
+    if not re.fullmatch(r'[0-9a-f]{32}', ticket):
+        raise KeyError(ticket)
+    return os.path.join(JOBS_DIR, ticket)
+
+
+def _page_path(ticket, page):
+    return os.path.join(_job_dir(ticket), 'page-{:05d}.gz'.format(page))
+
+
+def _write_status(ticket, status):
+    path = _job_dir(ticket)
+    os.makedirs(path, exist_ok=True)
+    # Write and rename so that readers never see a partial file.
+    tmp = os.path.join(path, 'status.json.tmp')
+    with open(tmp, 'w') as fh:
+        json.dump(status, fh)
+    os.replace(tmp, os.path.join(path, 'status.json'))
 
 
 def get_job(ticket: str):
-    celery_taskmeta = reflect('celery_taskmeta', postgres_base.metadata, engine)
-    query = celery_taskmeta.select().where(celery_taskmeta.c.task_id == ticket)
-    job_meta = dict(query.execute().first().items())
-    job_meta['result'] = pickle.loads(job_meta['result'])
+    """Look up the status of a job.
 
-    return job_meta
+    :param ticket: ticket handed out by make_job_response
+    :returns: dict describing the job, or None if there is no such job
+    """
+    try:
+        with open(os.path.join(_job_dir(ticket), 'status.json')) as fh:
+            return json.load(fh)
+    except (KeyError, FileNotFoundError):
+        return None
 
 
 def make_job_response(endpoint, validated_query):
-    msg = 'This feature, enabled by the jobs=true flag, is currently ' \
-          'undergoing maintenance, we apologize for any inconvenience.'
-    return jsonify({'unavailable': msg})
+    """Queue the current request to run in the background and respond with
+    the ticket for it.
+
+    :param endpoint: name of the endpoint being requested
+    :param validated_query: validator result for the request
+    """
+    from plenario.tasks import run_job
+
+    args = request.args.to_dict()
+    args.pop('job', None)
+    url = request.path + '?' + urlencode(sorted(args.items()))
+
+    ticket = uuid.uuid4().hex
+    _write_status(ticket, {
+        'ticket': ticket,
+        'endpoint': endpoint,
+        'request': url,
+        'status': 'queued',
+        'submitted': time.time()
+    })
+    run_job.apply_async((ticket, url), task_id=ticket)
+
+    response = jsonify({
+        'ticket': ticket,
+        'url': url_for('api.get_job_view', ticket=ticket, _external=True)
+    })
+    response.status_code = 202
+    # Every request gets its own ticket, so the response must not be cached.
+    response.cache_control.no_store = True
+    return response
+
+
+def check_query_cost(statement):
+    """Have the planner estimate the cost of a statement, without running it,
+    and raise QueryCostExceeded if it is over the app's QUERY_COST_LIMIT.
+
+    :param statement: select statement about to be executed
+    """
+    limit = current_app.config.get('QUERY_COST_LIMIT')
+    if not limit:
+        return
+    cost, rows = explain_cost(statement)
+    if cost > limit:
+        raise QueryCostExceeded(cost, rows)
+
+
+def expensive_query_response(endpoint, validated_query, exc):
+    """Respond to a request that was stopped by check_query_cost, either by
+    queueing it as a job or by rejecting it, depending on QUERY_COST_ACTION.
+
+    :param endpoint: name of the endpoint being requested
+    :param validated_query: validator result for the request
+    :param exc: the QueryCostExceeded that stopped it
+    """
+    from plenario.api.response import make_error
+
+    if current_app.config.get('QUERY_COST_ACTION') == 'job':
+        return make_job_response(endpoint, validated_query)
+
+    msg = '{}, over the limit of {:.0f}. Narrow the date range or area of the ' \
+          'query, or make it with job=true to have it run in the background.'
+    response = make_error(msg.format(exc, current_app.config['QUERY_COST_LIMIT']), 400)
+    # Whether a query is too expensive depends on the limit and the state of
+    # the tables at the time, it is no lasting property of the request.
+    response.cache_control.no_store = True
+    return response
+
+
+def execute_job(app, ticket, url):
+    """Run a queued request against the app and store its response.
+
+    :param app: flask application to run the request with
+    :param ticket: ticket of the job
+    :param url: path and query string of the request
+    """
+    prune_jobs()
+
+    status = get_job(ticket) or {'ticket': ticket, 'request': url}
+    status.update(status='running', started=time.time())
+    _write_status(ticket, status)
+
+    try:
+        with app.test_client() as client:
+            response = client.get(url)
+            pages = _write_pages(ticket, response.iter_encoded())
+    except Exception as e:
+        status.update(status='error', error=repr(e), finished=time.time())
+        _write_status(ticket, status)
+        raise
+
+    status.update(
+        status='success' if response.status_code < 400 else 'error',
+        status_code=response.status_code,
+        mimetype=response.mimetype,
+        pages=pages,
+        finished=time.time()
+    )
+    _write_status(ticket, status)
+
+
+def _write_pages(ticket, pieces, page_size=JOB_PAGE_SIZE):
+    """Write a response body as gzipped pages of about page_size bytes. Pages
+    end on a newline when there is one, so rows of a CSV stay whole.
+
+    :param ticket: ticket of the job
+    :param pieces: iterable of bytes making up the body
+    :returns: number of pages written
+    """
+    pages = 0
+    buffer = bytearray()
+
+    def flush(end):
+        nonlocal pages
+        with gzip.open(_page_path(ticket, pages), 'wb') as fh:
+            fh.write(buffer[:end])
+        del buffer[:end]
+        pages += 1
+
+    for piece in pieces:
+        buffer.extend(piece)
+        while len(buffer) >= page_size:
+            end = buffer.rfind(b'\n', 0, page_size) + 1
+            flush(end or page_size)
+
+    if buffer or not pages:
+        flush(len(buffer))
+    return pages
+
+
+def job_response(ticket):
+    """Respond with the status of a job, or with one page of its result when
+    a finished job is asked for ?page=N. Pages are sent still compressed to
+    clients that accept gzip.
+
+    :param ticket: ticket handed out by make_job_response
+    """
+    from plenario.api.response import make_error
+
+    status = get_job(ticket)
+    if status is None:
+        return make_error('Unknown ticket: {}'.format(ticket), 404)
+
+    page = request.args.get('page')
+    if page is None or status['status'] == 'queued' or status['status'] == 'running':
+        if 'pages' in status:
+            status['urls'] = [url_for('api.get_job_view', ticket=ticket, page=n, _external=True)
+                              for n in range(status['pages'])]
+        return jsonify(status)
+
+    try:
+        page = int(page)
+        path = _page_path(ticket, page)
+        if page < 0 or page >= status['pages']:
+            raise ValueError(page)
+    except (KeyError, ValueError):
+        return make_error('Invalid page: {}'.format(page), 404)
+
+    if 'gzip' in request.accept_encodings:
+        with open(path, 'rb') as fh:
+            response = Response(fh.read(), mimetype=status['mimetype'])
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        with gzip.open(path, 'rb') as fh:
+            response = Response(fh.read(), mimetype=status['mimetype'])
+
+    response.headers['X-Job-Page'] = page
+    response.headers['X-Job-Pages'] = status['pages']
+    return response
+
+
+def prune_jobs():
+    """Remove the results of jobs older than JOB_TTL."""
+    if not os.path.isdir(JOBS_DIR):
+        return
+    cutoff = time.time() - JOB_TTL
+    for name in os.listdir(JOBS_DIR):
+        path = os.path.join(JOBS_DIR, name)
+        try:
+            if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except FileNotFoundError:
+            pass
@@ -1,28 +1,27 @@
-import codecs
-import csv
-import io
 import json
 import re
 import traceback
 from collections import OrderedDict
 
-import shapely.geometry
-import shapely.wkb
 import sqlalchemy
+from sqlalchemy.dialects.postgresql import JSON
 
 from collections import OrderedDict
 from datetime import datetime, timedelta
 from dateutil import parser
 from flask import Response, jsonify, request, stream_with_context
 
-from plenario.api.common import CACHE_TIMEOUT, cache, crossdomain, make_cache_key, unknown_object_json_handler
+from plenario.api.common import CACHE_TIMEOUT, cache, crossdomain, encode_cursor, make_validated_cache_key, \
+    unknown_object_json_handler
 from plenario.api.condition_builder import parse_tree
-from plenario.api.jobs import get_job, make_job_response
+from plenario.api.jobs import QueryCostExceeded, check_query_cost, expensive_query_response, job_response, \
+    make_job_response
 from plenario.api.validator import DatasetRequiredValidator, NoDefaultDatesValidator, \
     NoGeoJSONDatasetRequiredValidator, NoGeoJSONValidator, has_tree_filters, validate, \
     PointsetRequiredValidator
-from plenario.database import postgres_session
+from plenario.database import copy_to_stream, literal_sql, parallel_copy_to_stream, postgres_session, stream_rows
 from plenario.models import MetaTable
+from plenario.utils.geom_cache import intersects_geom
 from . import response as api_response
 
 
@@ -30,14 +29,14 @@ from . import response as api_response
 # routes
 # ======
 
-# The get_job method in jobs.py does not have crossdomain, and is out of the
-# Flask context. So we define a wrapper here to access it.
+# The job_response method in jobs.py does not have crossdomain, so we define
+# a wrapper here to access it.
 @crossdomain(origin='*')
 def get_job_view(ticket):
-    return jsonify(get_job(ticket))
+    return job_response(ticket)
 
 
-@cache.cached(timeout=CACHE_TIMEOUT, key_prefix=make_cache_key)
+@cache.cached(timeout=CACHE_TIMEOUT, key_prefix=make_validated_cache_key(NoGeoJSONDatasetRequiredValidator))
 @crossdomain(origin='*')
 def detail_aggregate():
     fields = ('location_geom__within', 'dataset_name', 'agg', 'obs_date__ge',
@@ -50,17 +49,20 @@ def detail_aggregate():
 
     if validator_result.data.get('job'):
         return make_job_response('detail-aggregate', validator_result)
-    else:
+
+    try:
         time_counts = _detail_aggregate(validator_result)
-        return api_response.detail_aggregate_response(time_counts, validator_result)
+    except QueryCostExceeded as e:
+        return expensive_query_response('detail-aggregate', validator_result, e)
+    return api_response.detail_aggregate_response(time_counts, validator_result)
 
 
-@cache.cached(timeout=CACHE_TIMEOUT, key_prefix=make_cache_key)
+@cache.cached(timeout=CACHE_TIMEOUT, key_prefix=make_validated_cache_key(DatasetRequiredValidator))
 @crossdomain(origin='*')
 def detail():
     fields = ('location_geom__within', 'dataset_name', 'shape', 'obs_date__ge',
               'obs_date__le', 'data_type', 'offset', 'date__time_of_day_ge',
-              'date__time_of_day_le', 'limit', 'job')
+              'date__time_of_day_le', 'limit', 'cursor', 'job')
     validator = DatasetRequiredValidator(only=fields)
     validator_result = validate(validator, request.args.to_dict())
 
@@ -69,16 +71,21 @@ def detail():
 
     if validator_result.data.get('job'):
         return make_job_response('detail', validator_result)
-    else:
+
+    try:
+        if validator_result.data['data_type'] == 'geojson':
+            return _detail_geojson(validator_result)
         result_rows = _detail(validator_result)
-        return api_response.detail_response(result_rows, validator_result)
+    except QueryCostExceeded as e:
+        return expensive_query_response('detail', validator_result, e)
+    return api_response.detail_response(result_rows, validator_result)
 
 
 @crossdomain(origin='*')
 def datadump_view():
     fields = ('location_geom__within', 'dataset_name', 'shape', 'obs_date__ge',
               'obs_date__le', 'offset', 'date__time_of_day_ge',
-              'date__time_of_day_le', 'limit', 'job', 'data_type')
+              'date__time_of_day_le', 'limit', 'job', 'data_type', 'parallel')
 
     validator = DatasetRequiredValidator(only=fields)
     validator_result = validate(validator, request.args.to_dict())
@@ -86,6 +93,9 @@ def datadump_view():
     if validator_result.errors:
         return api_response.error(validator_result.errors, 400)
 
+    if validator_result.data.get('job'):
+        return make_job_response('datadump', validator_result)
+
     stream = datadump(**validator_result.data)
 
     dataset = validator_result.data['dataset'].name
@@ -97,7 +107,7 @@ def datadump_view():
     return attachment
 
 
-@cache.cached(timeout=CACHE_TIMEOUT, key_prefix=make_cache_key)
+@cache.cached(timeout=CACHE_TIMEOUT, key_prefix=make_validated_cache_key(PointsetRequiredValidator))
 @crossdomain(origin='*')
 def grid():
 
@@ -109,6 +119,7 @@ def grid():
         'obs_date__le',
         'obs_date__ge',
         'location_geom__within',
+        'job',
     )
 
     validator = PointsetRequiredValidator(only=fields)
@@ -116,7 +127,13 @@ def grid():
     if validator_result.errors:
         return api_response.bad_request(validator_result.errors)
 
-    results = _grid(validator_result)
+    if validator_result.data.get('job'):
+        return make_job_response('grid', validator_result)
+
+    try:
+        results = _grid(validator_result)
+    except QueryCostExceeded as e:
+        return expensive_query_response('grid', validator_result, e)
 
     query = validator.dumps(validator_result.data)
     query = json.loads(query.data)
@@ -124,7 +141,7 @@ def grid():
     return jsonify(results)
 
 
-@cache.cached(timeout=CACHE_TIMEOUT, key_prefix=make_cache_key)
+@cache.cached(timeout=CACHE_TIMEOUT, key_prefix=make_validated_cache_key(DatasetRequiredValidator))
 @crossdomain(origin='*')
 def dataset_fields(dataset_name):
     request_args = request.args.to_dict()
@@ -143,7 +160,7 @@ def dataset_fields(dataset_name):
         return api_response.fields_response(result_data, validator_result)
 
 
-@cache.cached(timeout=CACHE_TIMEOUT, key_prefix=make_cache_key)
+@cache.cached(timeout=CACHE_TIMEOUT, key_prefix=make_validated_cache_key(NoDefaultDatesValidator))
 @crossdomain(origin='*')
 def meta():
     fields = ('obs_date__le', 'obs_date__ge', 'dataset_name', 'location_geom__within', 'job')
@@ -193,16 +210,28 @@ def _detail_aggregate(args):
         tablename = re.split(r'__(?!_)', tablename)[0]
         table = MetaTable.get_by_dataset_name(tablename).point_table
         try:
-            conditions = parse_tree(table, condition_tree)
+            # An empty tree filters nothing, and leaving it out lets the
+            # timeseries be answered from the daily rollup.
+            if condition_tree.get('op') == 'and' and not condition_tree.get('val'):
+                conditions = None
+            else:
+                conditions = parse_tree(table, condition_tree)
         except ValueError:  # Catches empty condition tree.
             conditions = None
 
+        msg = 'Failed to construct timeseries'
         try:
-            ts = MetaTable.get_by_dataset_name(table.name).timeseries_one(
+            ts_select = MetaTable.get_by_dataset_name(table.name).timeseries(
                 agg, start_date, end_date, geom, conditions
             )
         except Exception as e:
-            msg = 'Failed to construct timeseries'
+            return api_response.make_raw_error('{}: {}'.format(msg, e))
+
+        check_query_cost(ts_select)
+
+        try:
+            ts = MetaTable.timeseries_rows(ts_select)
+        except Exception as e:
             return api_response.make_raw_error('{}: {}'.format(msg, e))
 
         time_counts += [{'count': c, 'datetime': d} for c, d in ts[1:]]
@@ -211,40 +240,84 @@ def _detail_aggregate(args):
 
 
 def _detail(args):
-    meta_params = ('dataset', 'shape', 'data_type', 'limit', 'offset')
+    meta_params = ('dataset', 'shape', 'data_type', 'limit', 'offset', 'cursor')
     meta_vals = (args.data.get(k) for k in meta_params)
-    dataset, shapeset, data_type, limit, offset = meta_vals
+    dataset, shapeset, data_type, limit, offset, cursor = meta_vals
 
-    q = detail_query(args).order_by(dataset.c.point_date.desc())
+    # The hash breaks ties between rows with the same point_date, which keeps
+    # the ordering stable enough to resume from a cursor.
+    q = detail_query(args).order_by(dataset.c.point_date.desc(), dataset.c.hash.desc())
 
-    # Apply limit and offset.
+    # Apply limit and offset. A cursor already points past the previous page,
+    # so an offset on top of it would skip rows.
     q = q.limit(limit)
-    q = q.offset(offset) if offset else q
+    q = q.offset(offset) if offset and not cursor else q
+
+    check_query_cost(q.statement)
 
     try:
         columns = [c.name for c in dataset.columns]
         if shapeset:
             columns += [c.name for c in shapeset.columns]
-        return [OrderedDict(list(zip(columns, row))) for row in q.all()]
+        rows = q.all()
+        args.data['next_cursor'] = _next_cursor(dataset, rows, limit)
+        return [OrderedDict(list(zip(columns, row))) for row in rows]
     except Exception as e:
         postgres_session.rollback()
         msg = 'Failed to fetch records.'
         return api_response.make_raw_error('{}: {}'.format(msg, e))
 
 
+def _detail_geojson(args):
+    """Like _detail, but has postgres build the rows as GeoJSON features.
+    The cursor for the next page goes in the FeatureCollection's meta.
+
+    :param args: validator result
+    :returns: response holding the FeatureCollection
+    """
+    dataset, shapeset, limit, offset, cursor = (
+        args.data.get(k) for k in ('dataset', 'shapeset', 'limit', 'offset', 'cursor')
+    )
+
+    q = detail_query(args).order_by(dataset.c.point_date.desc(), dataset.c.hash.desc())
+    q = q.limit(limit)
+    q = q.offset(offset) if offset and not cursor else q
+
+    features = _geojson_features(q, dataset, shapeset, hide={'point_date', 'hash'},
+                                 order_by=('point_date', 'hash'), with_key=True)
+    check_query_cost(features)
+
+    try:
+        rows = postgres_session.execute(features).fetchall()
+    except Exception as e:
+        postgres_session.rollback()
+        msg = 'Failed to fetch records.'
+        return api_response.make_error('{}: {}'.format(msg, e), 500)
+
+    next_cursor = None
+    if rows and limit is not None and len(rows) >= limit:
+        next_cursor = encode_cursor(rows[-1].point_date, rows[-1].hash)
+    meta = {'cursor': next_cursor}
+    collection = _feature_collection([','.join(row[0] for row in rows)], meta=meta)
+    return api_response.geojson_text_response(''.join(collection))
+
+
 def datadump(**kwargs):
     """Export the result of a detail query in geojson or csv format. Returns a
     generator that yields pieces of the export.
     """
     if kwargs.get('data_type') == 'json':
         return datadump_json(**kwargs)
+    if (kwargs.get('parallel') or 1) > 1:
+        return datadump_csv_parallel(**kwargs)
     return datadump_csv(**kwargs)
 
 
 def datadump_json(**kwargs):
     """Export the result of a detail query as valid geojson, where each row is
     formatted as a feature with its column-value pairs stored in the properties
-    field. Plenario derived columns are hidden.
+    field. Plenario derived columns are hidden. Postgres builds the features,
+    which are relayed in batches as they are read from a server-side cursor.
     """
     class ValidatorResultProxy(object):
         pass
@@ -253,45 +326,92 @@ def datadump_json(**kwargs):
     vr_proxy.data = kwargs
 
     dataset = kwargs['dataset']
-    columns = [c.name for c in dataset.c]
+    shapeset = kwargs.get('shapeset')
     query = detail_query(vr_proxy)
 
-    buffer = ''
-    chunksize = 1000
+    features = _geojson_features(query, dataset, shapeset, hide={'hash'})
+    batches = stream_rows(literal_sql(features))
+    return _feature_collection(','.join(row[0] for row in rows) for rows in batches)
 
-    yield "{'type': 'FeatureCollection', 'features': ["
 
-    for i, row in enumerate(query.yield_per(chunksize)):
-        wkb = row.geom
+def _geojson_features(query, dataset, shapeset=None, hide=(), order_by=(), with_key=False):
+    """Wrap a detail query in one that has postgres format each row as a
+    GeoJSON feature, returned as a single text column.
 
-        try:
-            geom = shapely.wkb.loads(wkb.desc, hex=True).__geo_interface__
-        except AttributeError:
-            continue
+    :param query: query produced by detail_query
+    :param dataset: point table being exported
+    :param shapeset: shape table joined to the point table, if any
+    :param hide: names of columns to leave out of the feature properties
+    :param order_by: names of exported columns to order the features by,
+                     descending
+    :param with_key: also select the point_date and hash of each feature
+    :returns: select statement
+    """
+    dump = _export_columns(query, dataset, shapeset).subquery('dump')
 
-        geojson = {
-            'type': 'Feature',
-            'geometry': geom,
-            'properties': dict(zip(columns, row))
-        }
-        del geojson['properties']['geom']
-        del geojson['properties']['hash']
+    properties = sqlalchemy.func.to_jsonb(sqlalchemy.literal_column('dump'))
+    for name in sorted(set(hide) | {'geom'}):
+        properties = properties.op('-')(name)
+
+    feature = sqlalchemy.func.json_build_object(
+        'type', 'Feature',
+        'geometry', sqlalchemy.cast(sqlalchemy.func.ST_AsGeoJSON(dump.c.geom), JSON),
+        'properties', properties
+    )
+    columns = [sqlalchemy.cast(feature, sqlalchemy.Text)]
+    if with_key:
+        columns += [dump.c.point_date, dump.c.hash]
+    sel = sqlalchemy.select(columns).select_from(dump)
+    return sel.order_by(*[dump.c[name].desc() for name in order_by])
 
-        buffer += json.dumps(geojson, default=unknown_object_json_handler)
-        buffer += ','
 
-        if i % chunksize == 0:
-            yield buffer
-            buffer = ''
+def _feature_collection(feature_batches, meta=None):
+    """Frame batches of comma-joined GeoJSON features as a FeatureCollection.
 
-    # Remove the trailing comma and close the json
-    yield buffer.rsplit(',', 1)[0] + ']}'
+    :param feature_batches: iterable of strings, each holding one or more
+                            features separated by commas
+    :param meta: dictionary to include as the collection's meta member
+    :returns: generator of strings
+    """
+    if meta is not None:
+        yield '{"type": "FeatureCollection", "meta": ' + json.dumps(meta) + ', "features": ['
+    else:
+        yield '{"type": "FeatureCollection", "features": ['
+    first = True
+    for batch in feature_batches:
+        if not batch:
+            continue
+        yield batch if first else ',' + batch
+        first = False
+    yield ']}'
 
 
 def datadump_csv(**kwargs):
     """Export the result of a detail query as a comma-delimited csv file. The
     header row is taken directly from the table's column list, with Plenario
-    derived values hidden.
+    derived values hidden. Rows are written out by postgres with COPY and
+    streamed back as they arrive.
+    """
+    class ValidatorResultProxy(object):
+        pass
+
+    vr_proxy = ValidatorResultProxy()
+    vr_proxy.data = kwargs
+
+    dataset = kwargs['dataset']
+    shapeset = kwargs.get('shapeset')
+    query = detail_query(vr_proxy)
+    query = _export_columns(query, dataset, shapeset, hide={'geom', 'hash'})
+
+    copy = 'COPY ({}) TO STDOUT WITH CSV HEADER'.format(literal_sql(query.statement))
+    return copy_to_stream(copy)
+
+
+def datadump_csv_parallel(**kwargs):
+    """Export the result of a detail query as a csv file, like datadump_csv,
+    but split the requested point_date range into slices that are read at the
+    same time. Every slice sees the same snapshot of the dataset, and slices
+    are written out in date order.
     """
     class ValidatorResultProxy(object):
         pass
@@ -300,28 +420,57 @@ def datadump_csv(**kwargs):
     vr_proxy.data = kwargs
 
     dataset = kwargs['dataset']
+    shapeset = kwargs.get('shapeset')
+    lower, upper = kwargs.get('obs_date__ge'), kwargs.get('obs_date__le')
+    if lower is None or upper is None:
+        return datadump_csv(**kwargs)
+
     query = detail_query(vr_proxy)
+    query = _export_columns(query, dataset, shapeset, hide={'geom', 'hash'})
 
-    rownum = 0
-    chunksize = 1000
-    hide = {'geom', 'hash'}
+    bounds = _date_slices(lower, upper, kwargs['parallel'])
+    statements = []
+    for i, (start, end) in enumerate(bounds):
+        in_slice = dataset.c.point_date >= start
+        if i < len(bounds) - 1:
+            in_slice = sqlalchemy.and_(in_slice, dataset.c.point_date < end)
+        sql = literal_sql(query.filter(in_slice).statement)
+        # Only the first slice carries the header row.
+        options = 'CSV HEADER' if i == 0 else 'CSV'
+        statements.append('COPY ({}) TO STDOUT WITH {}'.format(sql, options))
 
-    buffer = io.StringIO()
-    writer = csv.writer(buffer)
-    writer.writerow([c.name for c in dataset.c if c not in hide])
+    return parallel_copy_to_stream(statements)
 
-    for row in query.yield_per(chunksize):
-        rownum += 1
-        writer.writerow([getattr(row, c) for c in row.keys() if c not in hide])
 
-        if rownum % chunksize == 0:
-            yield buffer.getvalue()
-            buffer.close()
-            buffer = io.StringIO()
-            writer = csv.writer(buffer)
+def _date_slices(lower, upper, n):
+    """Split [lower, upper] into n consecutive ranges of equal length.
 
-    yield buffer.getvalue()
-    buffer.close()
+    :returns: list of (start, end) tuples
+    """
+    lower, upper = (d if isinstance(d, datetime) else datetime(d.year, d.month, d.day) for d in (lower, upper))
+    if lower >= upper:
+        return [(lower, upper)]
+    step = (upper - lower) / n
+    edges = [lower + step * i for i in range(n)] + [upper]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def _export_columns(query, dataset, shapeset=None, hide=()):
+    """Narrow a detail query down to the columns that are exported.
+
+    :param query: query produced by detail_query
+    :param dataset: point table being exported
+    :param shapeset: shape table joined to the point table, if any
+    :param hide: names of columns to leave out
+    :returns: query selecting only the visible columns, shape columns whose
+              names are already used by the point table are left out
+    """
+    columns = [c for c in dataset.c if c.name not in hide]
+    if shapeset is not None:
+        # Where the two tables share a column name, the point's value wins.
+        taken = set(dataset.c.keys()) | set(hide)
+        columns += [c.label(c.name) for c in shapeset.c if c.name not in taken]
+    return query.with_entities(*columns)
 
 
 def detail_query(args, aggregate=False):
@@ -349,11 +498,14 @@ def detail_query(args, aggregate=False):
     # Query the point dataset.
     q = postgres_session.query(dataset)
 
+    # If the user is paging with a cursor, seek past the last row they saw.
+    cursor = args.data.get('cursor')
+    if cursor:
+        q = q.filter(_seek_condition(dataset, *cursor))
+
     # If the user specified a geom, filter results to those within its shape.
     if geom:
-        q = q.filter(dataset.c.geom.ST_Within(
-            sqlalchemy.func.ST_GeomFromGeoJSON(geom)
-        ))
+        q = q.filter(intersects_geom(dataset.c.geom, geom))
 
     # Retrieve the filters and build conditions from them if they exist.
     point_ctree = filters.get(dataset.name + '__filter')
@@ -411,32 +563,42 @@ def _grid(args):
 
         metatable = MetaTable.get_by_dataset_name(tablename)
         table = metatable.point_table
-        conditions = parse_tree(table, condition_tree)
+        # make_grid expects conditions to be iterable. An empty tree filters
+        # nothing, and leaving it out lets the grid come from the pyramid.
+        if condition_tree.get('op') == 'and' and not condition_tree.get('val'):
+            conditions = []
+        else:
+            conditions = [parse_tree(table, condition_tree)]
 
+        msg = 'Could not make grid aggregation.'
         try:
-            registry_row = MetaTable.get_by_dataset_name(table.name)
-            # make_grid expects conditions to be iterable.
-            grid_rows, size_x, size_y = registry_row.make_grid(
+            grid_query, size_x, size_y = metatable.grid_query(
                 resolution,
                 geom,
-                [conditions],
+                conditions,
                 {'upper': obs_date__le, 'lower': obs_date__ge}
             )
-            result_rows += grid_rows
         except Exception as e:
-            msg = 'Could not make grid aggregation.'
+            return api_response.make_raw_error('{}: {}'.format(msg, e))
+
+        if grid_query is None:
+            continue
+        check_query_cost(grid_query)
+
+        try:
+            result_rows += postgres_session.execute(grid_query)
+        except Exception as e:
             return api_response.make_raw_error('{}: {}'.format(msg, e))
 
     resp = api_response.geojson_response_base()
-    for value in result_rows:
-        if value[1]:
-            pt = shapely.wkb.loads(codecs.decode(value[1], 'hex'))
-            south, west = (pt.x - (size_x / 2)), (pt.y - (size_y / 2))
-            north, east = (pt.x + (size_x / 2)), (pt.y + (size_y / 2))
-            new_geom = shapely.geometry.box(south, west, north, east).__geo_interface__
-        else:
-            new_geom = None
-        new_property = {'count': value[0], }
+    for count, x, y in result_rows:
+        west, south = x - (size_x / 2), y - (size_y / 2)
+        east, north = x + (size_x / 2), y + (size_y / 2)
+        new_geom = {
+            'type': 'Polygon',
+            'coordinates': [[[east, south], [east, north], [west, north], [west, south], [east, south]]]
+        }
+        new_property = {'count': count, }
         api_response.add_geojson_feature(resp, new_geom, new_property)
 
     return resp
@@ -477,11 +639,7 @@ def _meta(args):
     # Otherwise, just send back all the (filtered) datasets
     elif should_filter:
         if geom:
-            intersects = sqlalchemy.func.ST_Intersects(
-                sqlalchemy.func.ST_GeomFromGeoJSON(geom),
-                MetaTable.bbox
-            )
-            q = q.filter(intersects)
+            q = q.filter(intersects_geom(MetaTable.bbox, geom))
         if start_date and end_date:
             q = q.filter(
                 sqlalchemy.and_(
@@ -512,6 +670,46 @@ def _meta(args):
 # Utils
 # =====
 
+def _seek_condition(dataset, point_date, hash_):
+    """Build the condition that selects every row which comes after the
+    (point_date, hash) pair when rows are ordered by point_date and hash
+    descending. Postgres sorts nulls first in descending order, so rows with
+    a null point_date come before all the others.
+
+    :param dataset: point table being paged through
+    :param point_date: point_date of the last row seen
+    :param hash_: hash of the last row seen
+    :returns: SQLAlchemy condition
+    """
+    if point_date is None:
+        return sqlalchemy.or_(
+            sqlalchemy.and_(dataset.c.point_date.is_(None), dataset.c.hash < hash_),
+            dataset.c.point_date.isnot(None)
+        )
+    return sqlalchemy.or_(
+        dataset.c.point_date < point_date,
+        sqlalchemy.and_(dataset.c.point_date == point_date, dataset.c.hash < hash_)
+    )
+
+
+def _next_cursor(dataset, rows, limit):
+    """Make the cursor for the page following these rows. A short page is the
+    last page, so there is nothing to point to.
+
+    :param dataset: point table that was queried
+    :param rows: result rows, which start with the point table columns
+    :param limit: the page size that was requested
+    :returns: cursor string or None
+    """
+    if not rows or limit is None or len(rows) < limit:
+        return None
+
+    # Read by position, joined shape columns can share names with ours.
+    names = [c.name for c in dataset.columns]
+    last = rows[-1]
+    return encode_cursor(last[names.index('point_date')], last[names.index('hash')])
+
+
 def request_args_to_condition_tree(request_args, ignore=list()):
     """Take dictionary that has a 'dataset' key and column arguments into
     a single and build a condition tree.
@@ -520,8 +718,8 @@ def request_args_to_condition_tree(request_args, ignore=list()):
     :param ignore: what values to not use for building conditions
     :returns: condition tree
     """
-    ignored = {'agg', 'data_type', 'dataset', 'geom', 'limit', 'offset',
-               'shape', 'shapeset', 'job', 'all', 'datadump_part', 'datadump_total',
+    ignored = {'agg', 'data_type', 'dataset', 'geom', 'limit', 'offset', 'cursor', 'parallel',
+               'next_cursor', 'shape', 'shapeset', 'job', 'all', 'datadump_part', 'datadump_total',
                'datadump_requestid', 'datadump_urlroot', 'jobsframework_ticket', 'jobsframework_workerid',
                'jobsframework_workerbirthtime'}
     for val in ignore:
@@ -113,6 +113,7 @@ def form_json_detail_response(to_remove, validator, rows):
     remove_columns_from_dict(rows, to_remove)
     resp = json_response_base(validator, rows)
     resp['meta']['total'] = len(resp['objects'])
+    resp['meta']['cursor'] = validator.data.get('next_cursor')
     resp['meta']['query'] = request.args
     resp = make_response(
         json.dumps(resp, default=unknown_object_json_handler),
@@ -157,6 +158,12 @@ def form_geojson_detail_response(to_remove, rows):
     return resp
 
 
+def geojson_text_response(feature_collection):
+    resp = make_response(feature_collection, 200)
+    resp.headers['Content-Type'] = 'application/json'
+    return resp
+
+
 def convert_result_geoms(result):
     """Given a list of rows, convert the geom for each row from a shape
     to a list of coordinates.
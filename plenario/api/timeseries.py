@@ -10,7 +10,7 @@ from marshmallow.decorators import pre_dump, post_load
 from marshmallow.fields import Str, List
 from marshmallow.validate import OneOf
 
-from plenario.api.common import crossdomain, cache, CACHE_TIMEOUT, make_cache_key
+from plenario.api.common import crossdomain, cache, CACHE_TIMEOUT, make_validated_cache_key
 from plenario.api.condition_builder import parse_tree
 from plenario.api.fields import Geometry, Pointset, DateTime, Commalist
 from plenario.api.response import make_error, make_csv, make_response
@@ -48,7 +48,7 @@ class TimeseriesValidator(Schema):
         return data
 
 
-@cache.cached(timeout=CACHE_TIMEOUT, key_prefix=make_cache_key)
+@cache.cached(timeout=CACHE_TIMEOUT, key_prefix=make_validated_cache_key(TimeseriesValidator))
 @crossdomain(origin='*')
 def timeseries():
     validator = TimeseriesValidator()
@@ -88,7 +88,8 @@ def timeseries():
 
     point_set_names = [p.name for p in pointsets + [pointset] if p is not None]
     if not point_set_names:
-        point_set_names = MetaTable.index()
+        # Only bother querying the datasets whose extents overlap the request.
+        point_set_names = MetaTable.narrow_candidates(MetaTable.index(), start_date, end_date, geom)
 
     results = MetaTable.timeseries_all(point_set_names, agg, start_date, end_date, geom, ctrees)
 
@@ -11,12 +11,14 @@ from marshmallow.validate import Range, OneOf, ValidationError
 from sqlalchemy import MetaData
 from sqlalchemy.exc import DatabaseError, NoSuchTableError, ProgrammingError
 
-from plenario.api.common import extract_first_geometry_fragment, make_fragment_str
+from plenario.api.common import decode_cursor, extract_first_geometry_fragment, make_fragment_str
 from plenario.api.condition_builder import field_ops
 from plenario.database import postgres_session, redshift_engine
 from plenario.models import MetaTable, ShapeMetadata
 from plenario.models.SensorNetwork import FeatureMeta, NetworkMeta, NodeMeta, SensorMeta
 from plenario.sensor_network.api.sensor_aggregate_functions import aggregate_fn_map
+from plenario.settings import EXPORT_MAX_PARALLEL
+from plenario.utils.geom_cache import store_geom
 from plenario.utils.helpers import reflect
 
 
@@ -52,6 +54,13 @@ def validate_shapeset(name):
         raise ValidationError('Invalid shape name: {}.'.format(name))
 
 
+def validate_cursor(cursor):
+    try:
+        decode_cursor(cursor)
+    except ValueError as err:
+        raise ValidationError(str(err))
+
+
 def validate_many_datasets(list_of_datasets):
     for dataset in list_of_datasets:
         validate_dataset(dataset)
@@ -128,9 +137,11 @@ class Validator(Schema):
     obs_date__le = fields.DateTime(default=datetime.now())
     limit = fields.Integer(default=1000, validate=Range(0, 10000))
     offset = fields.Integer(default=0, validate=Range(0))
+    cursor = fields.Str(default=None, validate=validate_cursor)
     resolution = fields.Integer(default=500, validate=Range(0))
     job = fields.Bool(default=False)
     all = fields.Bool(default=False)
+    parallel = fields.Integer(default=1, validate=Range(1, EXPORT_MAX_PARALLEL))
 
 
 class DatasetRequiredValidator(Validator):
@@ -235,6 +246,16 @@ ValidatorResult = namedtuple('ValidatorResult', 'data errors warnings')
 # ==========
 # Callables which are used to convert request arguments to their correct types.
 
+
+def convert_geom(geojson_str):
+    """Turn a GeoJSON argument into the fragment that queries filter by, and
+    store its pieces for intersects_geom on the way.
+    """
+    fragment = make_fragment_str(extract_first_geometry_fragment(geojson_str))
+    store_geom(fragment)
+    return fragment
+
+
 converters = {
     'agg': str,
     'buffer': int,
@@ -250,8 +271,10 @@ converters = {
     'date': lambda x: parser.parse(x).date(),
     'point_date': lambda x: parser.parse(x),
     'offset': int,
+    'parallel': int,
+    'cursor': lambda x: decode_cursor(x) if x else None,
     'resolution': int,
-    'geom': lambda x: make_fragment_str(extract_first_geometry_fragment(x)),
+    'geom': convert_geom,
     'start_datetime': lambda x: x.isoformat().split('+')[0],
     'end_datetime': lambda x: x.isoformat().split('+')[0]
 }
@@ -362,7 +385,7 @@ def validate(validator, request_args):
             # These keys just have to do with the formatting of the JSON response.
             # We keep these values around even if they have no effect on a condition
             # tree.
-            elif key in {'geom', 'offset', 'limit', 'agg', 'obs_date__le', 'obs_date__ge'}:
+            elif key in {'geom', 'offset', 'cursor', 'limit', 'parallel', 'agg', 'obs_date__le', 'obs_date__ge'}:
                 pass
 
             # These keys are also ones that should be passed over when searching for
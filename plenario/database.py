@@ -1,13 +1,18 @@
 import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from logging import getLogger
+from queue import Empty, Full, Queue
 
 from sqlalchemy import create_engine
 from sqlalchemy.engine.base import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
 
-from plenario.settings import DATABASE_CONN, REDSHIFT_CONN
+from plenario.settings import DATABASE_CONN, EXPORT_POOL_SIZE, REDSHIFT_CONN
+from plenario.utils.helpers import TableRegistry
 
 
 logger = getLogger(__name__)
@@ -18,6 +23,14 @@ postgres_session = scoped_session(sessionmaker(bind=postgres_engine))
 postgres_base = declarative_base(bind=postgres_engine)
 postgres_base.query = postgres_session.query_property()
 
+# Parallel exports hold several connections each for as long as the client
+# is reading, so they get a pool of their own.
+export_engine = create_engine(DATABASE_CONN, pool_size=EXPORT_POOL_SIZE, max_overflow=0)
+_export_checkout_lock = threading.Lock()
+
+# Reflected point, shape and companion tables, shared by the whole process.
+table_registry = TableRegistry(postgres_base.metadata, postgres_engine)
+
 redshift_engine = create_engine(REDSHIFT_CONN, max_overflow=-1)
 redshift_session = scoped_session(sessionmaker(bind=redshift_engine, autocommit=True))
 redshift_base = declarative_base(bind=redshift_engine)
@@ -53,14 +66,247 @@ def create_extension(bind: Engine, extension: str) -> None:
     connection.close()
 
 
-def psql(path: str) -> None:
-    """Use psql to run a file at some path.
+def psql(path: str, stop_on_error: bool = False) -> None:
+    """Use psql to run a file at some path. With stop_on_error, stops at, and
+    raises for, the first statement that fails.
     """
     logger.info('[plenario] Psql file %s' % path)
-    command = 'psql {} -f {}'.format(DATABASE_CONN, path)
+    options = '-v ON_ERROR_STOP=1 ' if stop_on_error else ''
+    command = 'psql {} {}-f {}'.format(DATABASE_CONN, options, path)
     subprocess.check_call(command, shell=True)
 
 
+def literal_sql(statement, bind: Engine = postgres_engine) -> str:
+    """Render a SQLAlchemy statement as a string of SQL with its parameters
+    filled in, for use in places that only take raw SQL (like COPY). Values
+    are quoted by psycopg2, the same as if the statement had been executed.
+    """
+    compiled = statement.compile(dialect=bind.dialect)
+    connection = bind.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            return cursor.mogrify(str(compiled), compiled.params).decode('utf-8')
+    finally:
+        connection.close()
+
+
+def explain_cost(statement, bind: Engine = postgres_engine) -> tuple:
+    """Ask the planner what a statement would cost, without running it.
+
+    :returns: (estimated total cost, estimated number of rows)
+    """
+    compiled = statement.compile(dialect=bind.dialect)
+    connection = bind.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + str(compiled), compiled.params)
+            plan = cursor.fetchone()[0][0]['Plan']
+        connection.rollback()
+        return plan['Total Cost'], plan['Plan Rows']
+    finally:
+        connection.close()
+
+
+class _QueueWriter(object):
+    """File-like target for psycopg2's copy_expert that hands each chunk it is
+    given over to a queue, waiting when the queue is full. Raises once the
+    reader has gone away, which aborts the COPY."""
+
+    def __init__(self, queue: Queue, stopped: threading.Event):
+        self.queue = queue
+        self.stopped = stopped
+
+    def write(self, data):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(data, timeout=1)
+                return len(data)
+            except Full:
+                continue
+        raise IOError('Reader stopped consuming COPY output.')
+
+
+def copy_to_stream(sql: str, bind: Engine = postgres_engine, buffered_chunks: int = 64):
+    """Run COPY ... TO STDOUT and yield its output in chunks of bytes as they
+    come off the wire, without building rows in Python. The COPY runs in a
+    separate thread, and is throttled by how fast the chunks are consumed.
+    """
+    chunks = Queue(maxsize=buffered_chunks)
+    stopped = threading.Event()
+    finished = object()
+    failure = []
+
+    def copy():
+        connection = bind.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.copy_expert(sql, _QueueWriter(chunks, stopped))
+            connection.commit()
+        except Exception as exc:
+            connection.rollback()
+            failure.append(exc)
+        finally:
+            connection.close()
+            while not stopped.is_set():
+                try:
+                    chunks.put(finished, timeout=1)
+                    break
+                except Full:
+                    continue
+
+    thread = threading.Thread(target=copy, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            try:
+                chunk = chunks.get(timeout=1)
+            except Empty:
+                continue
+            if chunk is finished:
+                break
+            yield chunk if isinstance(chunk, bytes) else chunk.encode('utf-8')
+    finally:
+        stopped.set()
+        thread.join()
+
+    if failure:
+        raise failure[0]
+
+
+class _CopyJob(object):
+    """One statement of a parallel export and the connection it runs on. The
+    connection is given back exactly once, and can only be cancelled until
+    then, so that a cancel never reaches whoever uses it next."""
+
+    def __init__(self, statement: str, connection):
+        self.statement = statement
+        self.connection = connection
+        self._lock = threading.Lock()
+        self._released = False
+
+    def cancel(self):
+        with self._lock:
+            if not self._released:
+                self.connection.cancel()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        try:
+            self.connection.rollback()
+        finally:
+            self.connection.close()
+
+
+class _StoppableWriter(object):
+    """File-like target for psycopg2's copy_expert that passes writes through
+    to another file until it is stopped, after which it raises and so aborts
+    the COPY."""
+
+    def __init__(self, output, stopped: threading.Event):
+        self.output = output
+        self.stopped = stopped
+
+    def write(self, data):
+        if self.stopped.is_set():
+            raise IOError('Reader stopped consuming COPY output.')
+        return self.output.write(data)
+
+
+def _close_output(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def parallel_copy_to_stream(statements: list, bind: Engine = export_engine, chunk_size: int = 1 << 20):
+    """Run several COPY ... TO STDOUT statements at once, each on its own
+    connection, and yield their output in the order the statements were given.
+    The connections share one exported snapshot, so together they see the
+    database exactly as a single transaction would.
+
+    All the connections are taken from the pool at once, so exports waiting
+    on a busy pool can't each hold part of what they need. If the reader goes
+    away, the COPYs still running are cancelled rather than waited on.
+    """
+    with _export_checkout_lock:
+        connections = []
+        try:
+            for _ in range(len(statements) + 1):
+                connections.append(bind.raw_connection())
+        except Exception:
+            for connection in connections:
+                connection.close()
+            raise
+
+    leader = connections[0]
+    stopped = threading.Event()
+    jobs = [_CopyJob(statement, connection) for statement, connection in zip(statements, connections[1:])]
+
+    def copy(job, snapshot):
+        output = tempfile.TemporaryFile()
+        try:
+            with job.connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+                cursor.execute('SET TRANSACTION SNAPSHOT %s', (snapshot,))
+                cursor.copy_expert(job.statement, _StoppableWriter(output, stopped))
+            output.seek(0)
+            return output
+        except Exception:
+            output.close()
+            raise
+        finally:
+            job.release()
+
+    executor = ThreadPoolExecutor(max_workers=len(statements))
+    futures = []
+    try:
+        with leader.cursor() as cursor:
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            cursor.execute('SELECT pg_export_snapshot()')
+            snapshot = cursor.fetchone()[0]
+
+        futures = [executor.submit(copy, job, snapshot) for job in jobs]
+        for future in futures:
+            with future.result() as output:
+                for chunk in iter(lambda: output.read(chunk_size), b''):
+                    yield chunk
+    finally:
+        stopped.set()
+        for i, job in enumerate(jobs):
+            if i >= len(futures) or futures[i].cancel():
+                job.release()
+            else:
+                job.cancel()
+        for future in futures:
+            future.add_done_callback(_close_output)
+        executor.shutdown(wait=False)
+        try:
+            leader.rollback()
+        finally:
+            leader.close()
+
+
+def stream_rows(sql: str, bind: Engine = postgres_engine, itersize: int = 2000):
+    """Run a query with a server-side cursor and yield its rows in lists of
+    up to itersize, so that only one batch is held in memory at a time.
+    """
+    connection = bind.raw_connection()
+    try:
+        with connection.cursor(name='plenario_stream_rows') as cursor:
+            cursor.itersize = itersize
+            cursor.execute(sql)
+            while True:
+                rows = cursor.fetchmany(itersize)
+                if not rows:
+                    break
+                yield rows
+    finally:
+        connection.close()
+
+
 @contextmanager
 def postgres_session_context():
     """A helper method for keeping the state of an connection with the database
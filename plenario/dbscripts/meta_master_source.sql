@@ -0,0 +1,24 @@
+-- Columns recording the version of each dataset's source as of its last load,
+-- for databases made before they were added to MetaTable.
+DO $$
+DECLARE
+  col RECORD;
+BEGIN
+  FOR col IN SELECT * FROM (VALUES
+    ('source_etag', 'VARCHAR'),
+    ('source_last_modified', 'VARCHAR'),
+    ('source_length', 'BIGINT'),
+    ('source_checksum', 'VARCHAR(32)')
+  ) AS c (name, type)
+  LOOP
+    IF NOT EXISTS (
+      SELECT 1 FROM information_schema.columns
+      WHERE table_schema = current_schema()
+        AND table_name = 'meta_master'
+        AND column_name = col.name
+    ) THEN
+      EXECUTE format('ALTER TABLE meta_master ADD COLUMN %I %s', col.name, col.type);
+    END IF;
+  END LOOP;
+END
+$$;
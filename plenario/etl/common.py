@@ -1,6 +1,9 @@
+import csv
 import requests
 import tempfile
 
+from collections import namedtuple
+from hashlib import md5
 from logging import getLogger
 from plenario.database import postgres_engine
 
@@ -13,6 +16,15 @@ class PlenarioETLError(Exception):
         self.message = message
 
 
+# Validators of a downloaded source: its ETag, Last-Modified and
+# Content-Length headers, and the md5 of its contents.
+SourceVersion = namedtuple('SourceVersion', 'etag last_modified length checksum')
+
+
+class SourceUnchanged(Exception):
+    """Raised by ETLFile when the source is the same as its last_seen version."""
+
+
 class ETLFile(object):
     """
     Encapsulates whether a file has been downloaded temporarily
@@ -22,7 +34,15 @@ class ETLFile(object):
 
     Implements context manager interface with __enter__ and __exit__.
     """
-    def __init__(self, source_path=None, source_url=None, interpret_as='text'):
+    def __init__(self, source_path=None, source_url=None, interpret_as='text', last_seen=None):
+        """
+        :param source_path: path of file on local filesystem
+        :param source_url: url to download the file from
+        :param interpret_as: 'text' or 'bytes'
+        :param last_seen: SourceVersion of the source as last downloaded.
+                          If given, downloading raises SourceUnchanged
+                          instead of returning the same file again.
+        """
 
         logger.info('Begin.')
         logger.info('source_path: {}'.format(source_path))
@@ -38,6 +58,9 @@ class ETLFile(object):
         self.source_path = source_path
         self.source_url = source_url
         self.is_local = bool(source_path)
+        self.last_seen = last_seen
+        # SourceVersion of the downloaded file, None for local files.
+        self.version = None
         self._handle = None
         logger.info('End')
 
@@ -80,15 +103,26 @@ class ETLFile(object):
         Download file to local data directory.
         :param url: url from where file should be downloaded
         :type url: str
-        :raises: IOError
+        :raises: IOError, SourceUnchanged
         """
 
         logger.info('Begin. (url: {})'.format(url))
+        # Let the server tell us if the source hasn't changed,
+        # if it kept validators for it last time.
+        headers = {}
+        if self.last_seen and self.last_seen.etag:
+            headers['If-None-Match'] = self.last_seen.etag
+        if self.last_seen and self.last_seen.last_modified:
+            headers['If-Modified-Since'] = self.last_seen.last_modified
+
         # The file might be big, so stream it in chunks.
         # I'd like to enforce a timeout, but some big datasets
         # take more than a minute to start streaming.
         # Maybe add timeout as a parameter.
-        file_stream_request = requests.get(url, stream=True)
+        file_stream_request = requests.get(url, stream=True, headers=headers)
+        if file_stream_request.status_code == 304:
+            file_stream_request.close()
+            raise SourceUnchanged(url)
         # Raise an exception if we didn't get a 200
         file_stream_request.raise_for_status()
 
@@ -96,13 +130,88 @@ class ETLFile(object):
         self.handle = tempfile.NamedTemporaryFile()
 
         # Download and write to disk in 1MB chunks.
+        checksum = md5()
         for chunk in file_stream_request.iter_content(chunk_size=1024*1024):
             if chunk:
+                checksum.update(chunk)
                 self._handle.write(chunk)
                 self._handle.flush()
+
+        length = file_stream_request.headers.get('Content-Length')
+        self.version = SourceVersion(
+            etag=file_stream_request.headers.get('ETag'),
+            last_modified=file_stream_request.headers.get('Last-Modified'),
+            length=int(length) if length and length.isdigit() else None,
+            checksum=checksum.hexdigest()
+        )
+
+        # Servers without validators send everything every time,
+        # so compare the contents too.
+        if self.last_seen and self.last_seen.checksum == self.version.checksum:
+            self._handle.close()
+            raise SourceUnchanged(url)
         logger.info('End.')
 
 
+class HashingReader(object):
+    """
+    Read-only file object over a CSV that adds a hash column to it,
+    for loading with COPY. Each row's hash is the md5 of its text,
+    so identical rows get the same hash
+    and can be told apart from changed ones on the way in,
+    without a pass over the loaded table.
+    Rows are passed on exactly as they appear in the source,
+    so that COPY still loads a quoted empty field as an empty string
+    and an unquoted one as NULL.
+    Blank lines are dropped.
+    """
+
+    def __init__(self, f):
+        """
+        :param f: Open file handle pointing to start of CSV
+        """
+        self._lines = self._hashed_lines(f)
+        self._buffer = ''
+
+    @staticmethod
+    def _hashed_lines(f):
+        # The csv reader only finds where each record ends, which may be a
+        # few lines on when a quoted value spans lines. It reads no further
+        # than that, so the lines taken since the last record make up the
+        # text of the current one.
+        consumed = []
+
+        def lines():
+            for line in f:
+                consumed.append(line)
+                yield line
+
+        reader = csv.reader(lines())
+        for i, row in enumerate(reader):
+            text = ''.join(consumed).rstrip('\r\n')
+            del consumed[:]
+            if i == 0:
+                yield text + ',hash\n'
+            elif row:
+                yield text + ',' + md5(text.encode('utf-8')).hexdigest() + '\n'
+
+    def read(self, size=-1):
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        for line in self._lines:
+            chunks.append(line)
+            length += len(line)
+            if 0 <= size <= length:
+                break
+
+        data = ''.join(chunks)
+        if size < 0:
+            self._buffer = ''
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+
 def add_unique_hash(table_name):
     """
     Adds an md5 hash column of the preexisting columns
@@ -1,17 +1,20 @@
 # import json
 
 # from csvkit.unicsv import UnicodeCSVReader
-import csv
 from logging import getLogger
 from geoalchemy2 import Geometry
-from sqlalchemy import TIMESTAMP, Table, Column, MetaData, String
-from sqlalchemy import select, func
+from sqlalchemy import TIMESTAMP, Table, Column, MetaData, String, Integer, Float
+from sqlalchemy import and_, literal, not_, select, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import NoSuchTableError
 
 from plenario.database import postgres_base, postgres_engine
 from plenario.database import postgres_session
-from plenario.etl.common import ETLFile, add_unique_hash, PlenarioETLError, delete_absent_hashes
-from plenario.utils.helpers import iter_column, slugify
+from plenario.etl.common import ETLFile, HashingReader, PlenarioETLError, SourceUnchanged, SourceVersion
+from plenario.models.MetaTable import CUBE_PRECISION, GRID_RESOLUTIONS, MetaTable
+from plenario.settings import INFERENCE_MAX_ROWS
+from plenario.utils.cache_versions import bump_dataset_version
+from plenario.utils.helpers import get_size_in_degrees, iter_columns, slugify
 
 logger = getLogger(__name__)
 
@@ -42,12 +45,57 @@ class PlenarioETL(object):
         logger.info('Begin.')
         with self.staging_table as s_table:
             new_table = Creation(s_table.table, self.dataset).table
-        update_meta(self.metadata, new_table)
+        update_meta(self.metadata, new_table, self.staging_table.file_helper.version)
         logger.info('End.')
         return new_table
 
     def update(self):
-        self.add()
+        """
+        Bring an existing point table up to date with the source.
+        If the source hasn't changed since it was last loaded,
+        nothing is downloaded or loaded.
+        Otherwise records whose hashes are new are inserted
+        and records whose hashes are gone from the source are deleted,
+        leaving the rest of the table and its indexes alone.
+        Both happen in one transaction, so readers never see
+        a partly refreshed table.
+        If the table or any of its companion tables is missing,
+        or the source's columns no longer match the table's,
+        the table is created over again as with add().
+        """
+        logger.info('Begin.')
+        try:
+            existing = Table(self.dataset.name, MetaData(), autoload_with=postgres_engine)
+        except NoSuchTableError:
+            return self.add()
+
+        if not all(postgres_engine.has_table(t.name) for t in _companion_tables(self.dataset.name)):
+            logger.info('Missing companion tables, creating {} over again.'.format(self.dataset.name))
+            return self.add()
+
+        m = self.metadata
+        self.staging_table.file_helper.last_seen = SourceVersion(
+            m.source_etag, m.source_last_modified, m.source_length, m.source_checksum
+        )
+
+        try:
+            with self.staging_table as s_table:
+                if _column_types(s_table.table) != _column_types(existing):
+                    logger.info('Columns changed, creating {} over again.'.format(self.dataset.name))
+                    table = Creation(s_table.table, self.dataset).table
+                else:
+                    with postgres_engine.begin() as connection:
+                        with Deletion(s_table.table, self.dataset, existing, bind=connection) as absent:
+                            absent.delete()
+                        with Update(s_table.table, self.dataset, existing, bind=connection) as new:
+                            new.insert()
+                    table = existing
+        except SourceUnchanged:
+            logger.info('Source of {} is unchanged, skipping.'.format(self.dataset.name))
+            return existing
+        update_meta(self.metadata, table, self.staging_table.file_helper.version)
+        logger.info('End.')
+        return table
 
 
 class Staging(object):
@@ -97,7 +145,6 @@ class Staging(object):
             # Grab the handle to build a table from the CSV
             try:
                 self.table = self._make_table(text_handle)
-                add_unique_hash(self.table.name)
                 self.table = Table(
                     self.name,
                     postgres_base.metadata,
@@ -129,12 +176,16 @@ class Staging(object):
         # so that we can access it when we drop down to a raw connection.
 
         # Be paranoid and remove the table if one by this name already exists.
-        table = Table(self.name, MetaData(), *self.cols, extend_existing=True)
+        # Duplicate rows are loaded too, they share a hash
+        # and are dropped by the unique index on hash in the tables they go on to.
+        table = Table(self.name, MetaData(), *(self.cols + [Column('hash', String(32))]),
+                      extend_existing=True)
         self._drop()
         table.create(bind=postgres_engine)
 
-        # Fill in the columns we expect from the CSV.
-        names = ['"' + c.name + '"' for c in self.cols]
+        # Fill in the columns we expect from the CSV,
+        # and the hash of each row as it is read.
+        names = ['"' + c.name + '"' for c in table.columns]
         copy_st = "COPY {t_name} ({cols}) FROM STDIN " \
                   "WITH (FORMAT CSV, HEADER TRUE, DELIMITER ',')".\
             format(t_name=self.name, cols=', '.join(names))
@@ -144,7 +195,7 @@ class Staging(object):
         try:
             with conn.cursor() as cursor:
                 f.seek(0)
-                cursor.copy_expert(copy_st, f)
+                cursor.copy_expert(copy_st, HashingReader(f))
                 conn.commit()
                 return table
         except Exception as e:
@@ -180,24 +231,65 @@ class Staging(object):
         """Generate columns by scanning CSV and inferring column types."""
 
         logger.info('Begin.')
-        reader = csv.reader(f)
-        header = list(map(slugify, next(reader)))
+        header, types = iter_columns(f, INFERENCE_MAX_ROWS or None)
 
         cols = []
-        for col_idx, col_name in enumerate(header):
-            col_type, nullable = iter_column(col_idx, f)
+        for col_name, (col_type, nullable) in zip(map(slugify, header), types):
             cols.append(_make_col(col_name, col_type, nullable))
 
         logger.info('End.')
         return cols
 
 
-def _null_malformed_geoms(existing):
+def _null_malformed_geoms(existing, bind=postgres_engine):
     # We decide to set the geom to NULL when the given lon/lat is (0,0)
     # (off the coast of Africa).
     upd = existing.update().values(geom=None).\
         where(existing.c.geom == select([func.ST_SetSRID(func.ST_MakePoint(0, 0), 4326)]))
-    postgres_engine.execute(upd)
+    bind.execute(upd)
+
+
+def _make_rollup_table(dataset_name):
+    """Describe the companion table (prefixed with r_) that holds the number
+    of records a point dataset has for each day. Aggregate queries sum it
+    instead of scanning the full point table."""
+    return Table('r_' + dataset_name, MetaData(),
+                 Column('day', TIMESTAMP, primary_key=True),
+                 Column('count', Integer, nullable=False))
+
+
+def _make_grid_table(dataset_name):
+    """Describe the companion table (prefixed with g_) that holds the number
+    of records a point dataset has in each grid cell for each day, at each of
+    the resolutions in GRID_RESOLUTIONS. Cells are identified by their snapped
+    center and are size_x by size_y degrees."""
+    return Table('g_' + dataset_name, MetaData(),
+                 Column('resolution', Integer, primary_key=True),
+                 Column('day', TIMESTAMP, primary_key=True),
+                 Column('x', Float, primary_key=True),
+                 Column('y', Float, primary_key=True),
+                 Column('count', Integer, nullable=False),
+                 Column('size_x', Float, nullable=False),
+                 Column('size_y', Float, nullable=False))
+
+
+def _make_cube_table(dataset_name):
+    """Describe the companion table (prefixed with c_) that holds the number
+    of records a point dataset has in each geohash cell for each day. Cells
+    are geohashes of CUBE_PRECISION characters, and the cell polygon is kept
+    alongside so that cells can be matched against a query polygon with the
+    spatial index."""
+    return Table('c_' + dataset_name, MetaData(),
+                 Column('cell', String(CUBE_PRECISION), primary_key=True),
+                 Column('day', TIMESTAMP, primary_key=True),
+                 Column('count', Integer, nullable=False),
+                 Column('geom', Geometry('POLYGON', srid=4326), nullable=False))
+
+
+def _companion_tables(dataset_name):
+    return [_make_rollup_table(dataset_name),
+            _make_grid_table(dataset_name),
+            _make_cube_table(dataset_name)]
 
 
 def _make_col(name, type, nullable):
@@ -228,6 +320,8 @@ class Creation(object):
                 new.insert()
             except Exception as e:
                 self.table.drop(bind=postgres_engine, checkfirst=True)
+                for table in _companion_tables(self.dataset.name):
+                    table.drop(bind=postgres_engine, checkfirst=True)
                 raise e
 
     def _init_table(self):
@@ -250,6 +344,12 @@ class Creation(object):
 
         new_table.drop(postgres_engine, checkfirst=True)
         new_table.create(postgres_engine)
+
+        # Start the daily rollup, grid pyramid and count cube over
+        # along with the table they summarize.
+        for table in _companion_tables(self.dataset.name):
+            table.drop(postgres_engine, checkfirst=True)
+            table.create(postgres_engine)
         return new_table
 
     def _add_trigger(self):
@@ -265,18 +365,28 @@ class Update(object):
     Create a table that contains the business key, geom, and date
     of all records found in the staging table and not in the existing table.
     """
-    def __init__(self, staging, dataset, existing):
+    # Prefix of the table of changed records, and whether their counts are
+    # added to or taken off the companion tables.
+    prefix = 'n_'
+    sign = 1
+
+    def __init__(self, staging, dataset, existing, bind=postgres_engine):
         """
 
         :param staging: Table full of CSV data.
         :param dataset: named tuple of type Dataset
+        :param bind: engine, or connection in a transaction, to run statements on
         """
         self.staging = staging
         self.dataset = dataset
         self.existing = existing
+        self.bind = bind
+        self.rollup = _make_rollup_table(dataset.name)
+        self.grid = _make_grid_table(dataset.name)
+        self.cube = _make_cube_table(dataset.name)
 
         # We'll name it n_table
-        self.name = 'n_' + dataset.name
+        self.name = self.prefix + dataset.name
 
         # This table will only have the hash
         # and the two derived columns for space and time.
@@ -295,68 +405,198 @@ class Update(object):
         """
 
         # create n_table with point_date, geom, and id columns
-        s = self.staging
-        e = self.existing
-        d = self.dataset
-
-        derived_dates = func.cast(s.c[d.date], TIMESTAMP).label('point_date')
-        derived_geoms = self._geom_col()
-        cols_to_insert = [s.c['hash'], derived_dates, derived_geoms]
-
-        # Select the hash and the columns we're deriving from the staging table.
-        sel = select(cols_to_insert)
-        # And limit our results to records
-        # whose hashes aren't already present in the existing table.
-        sel = sel.select_from(s.outerjoin(e, s.c['hash'] == e.c['hash'])).\
-            where(e.c['hash'] == None)
+        sel = self._changed()
 
         # Drop the table first out of healthy paranoia
         self._drop()
         try:
-            self.table.create(bind=postgres_engine)
+            self.table.create(bind=self.bind)
         except Exception as e:
             raise PlenarioETLError(repr(e) +
-                                   '\nCould not create table n_' + d.name)
+                                   '\nCould not create table ' + self.name)
 
-        ins = self.table.insert().from_select(cols_to_insert, sel)
+        ins = pg_insert(self.table).from_select(['hash', 'point_date', 'geom'], sel)
+        # Rows that appear more than once in the source are only added once.
+        ins = ins.on_conflict_do_nothing(index_elements=[self.table.c.hash])
         # Populate it with records from our select statement.
         try:
-            postgres_engine.execute(ins)
+            self.bind.execute(ins)
         except Exception as e:
             raise PlenarioETLError(repr(e) + '\n' + str(sel))
         else:
             # Would be nice to check if we have new records or not right here.
             return self
 
+    def _changed(self):
+        """
+        Select the hash and the columns we're deriving from the staging table
+        for records whose hashes aren't already present in the existing table.
+        """
+        s = self.staging
+        e = self.existing
+        d = self.dataset
+
+        derived_dates = func.cast(s.c[d.date], TIMESTAMP).label('point_date')
+        derived_geoms = self._geom_col()
+
+        sel = select([s.c['hash'], derived_dates, derived_geoms])
+        return sel.select_from(s.outerjoin(e, s.c['hash'] == e.c['hash'])).\
+            where(e.c['hash'] == None)
+
     def insert(self):
         """
         Join with the staging table
         to insert complete records into existing table.
         """
+        # Null out (0,0) geoms among the new records only,
+        # rather than going over the whole existing table for them.
+        try:
+            _null_malformed_geoms(self.table, self.bind)
+        except Exception as e:
+            raise PlenarioETLError(repr(e) +
+                        '\n Failed to null out geoms with (0,0) geocoding')
+
         derived_cols = [c for c in self.table.c
                         if c.name in {'geom', 'point_date'}]
         staging_cols = [c for c in self.staging.c]
         sel_cols = staging_cols + derived_cols
 
         sel = select(sel_cols).where(self.staging.c.hash == self.table.c.hash)
-        ins = self.existing.insert().from_select(sel_cols, sel)
+        ins = pg_insert(self.existing).from_select(sel_cols, sel)
+        ins = ins.on_conflict_do_nothing(index_elements=[self.existing.c.hash])
 
         try:
-            postgres_engine.execute(ins)
+            self.bind.execute(ins)
         except Exception as e:
             raise PlenarioETLError(repr(e) +
                                    '\n Failed on statement: ' + str(ins))
+        self._update_rollup()
+        self._update_grid()
+        self._update_cube()
+
+    def _update_rollup(self):
+        """
+        Add the new records to the daily counts in the rollup table.
+        """
+        day = func.date_trunc('day', self.table.c.point_date)
+        sel = select([day.label('day'), (func.count() * self.sign).label('count')]).\
+            where(self.table.c.point_date != None).\
+            group_by(day)
+
+        ins = pg_insert(self.rollup).from_select(['day', 'count'], sel)
+        ins = ins.on_conflict_do_update(
+            index_elements=[self.rollup.c.day],
+            set_={'count': self.rollup.c['count'] + ins.excluded['count']}
+        )
+
         try:
-            _null_malformed_geoms(self.existing)
+            self.bind.execute(ins)
         except Exception as e:
             raise PlenarioETLError(repr(e) +
-                        '\n Failed to null out geoms with (0,0) geocoding')
+                                   '\n Failed to update rollup table ' + self.rollup.name)
+
+    def _update_grid(self):
+        """
+        Add the new records to the cell counts of each level of the grid
+        pyramid. Records without a usable location are left out.
+        """
+        n = self.table
+        located = self._located()
+
+        for resolution, (size_x, size_y) in self._grid_sizes(located).items():
+            snapped = func.ST_SnapToGrid(n.c.geom, 0, 0, size_x, size_y)
+            day = func.date_trunc('day', n.c.point_date)
+            x, y = func.ST_X(snapped), func.ST_Y(snapped)
+
+            sel = select([
+                literal(resolution), day, x, y, func.count() * self.sign, literal(size_x), literal(size_y)
+            ]).where(located).group_by(day, x, y)
+
+            cols = ['resolution', 'day', 'x', 'y', 'count', 'size_x', 'size_y']
+            ins = pg_insert(self.grid).from_select(cols, sel)
+            ins = ins.on_conflict_do_update(
+                index_elements=[self.grid.c.resolution, self.grid.c.day, self.grid.c.x, self.grid.c.y],
+                set_={'count': self.grid.c['count'] + ins.excluded['count']}
+            )
+
+            try:
+                self.bind.execute(ins)
+            except Exception as e:
+                raise PlenarioETLError(repr(e) +
+                                       '\n Failed to update grid table ' + self.grid.name)
+
+    def _update_cube(self):
+        """
+        Add the new records to the daily geohash cell counts of the count
+        cube. Records without a usable location are left out, as are
+        coordinates outside the range a geohash can encode.
+        """
+        n = self.table
+        located = and_(
+            self._located(),
+            func.ST_X(n.c.geom).between(-180, 180),
+            func.ST_Y(n.c.geom).between(-90, 90)
+        )
+
+        cell = func.ST_GeoHash(n.c.geom, CUBE_PRECISION)
+        day = func.date_trunc('day', n.c.point_date)
+        counts = select([cell.label('cell'), day.label('day'), (func.count() * self.sign).label('count')]).\
+            where(located).\
+            group_by(cell, day).\
+            alias('counts')
+
+        cell_geom = func.ST_SetSRID(func.ST_GeomFromGeoHash(counts.c.cell), 4326)
+        sel = select([counts.c.cell, counts.c.day, counts.c['count'], cell_geom])
+
+        ins = pg_insert(self.cube).from_select(['cell', 'day', 'count', 'geom'], sel)
+        ins = ins.on_conflict_do_update(
+            index_elements=[self.cube.c.cell, self.cube.c.day],
+            set_={'count': self.cube.c['count'] + ins.excluded['count']}
+        )
+
+        try:
+            self.bind.execute(ins)
+        except Exception as e:
+            raise PlenarioETLError(repr(e) +
+                                   '\n Failed to update count cube ' + self.cube.name)
+
+    def _located(self):
+        """Condition for new records that have both a date and a usable location."""
+        n = self.table
+        return and_(
+            n.c.geom != None,
+            n.c.point_date != None,
+            not_(and_(func.ST_X(n.c.geom) == 0, func.ST_Y(n.c.geom) == 0))
+        )
+
+    def _grid_sizes(self, located):
+        """
+        Cell sizes in degrees for each resolution of the grid pyramid. Sizes
+        are fixed when the pyramid is first built, so that later updates snap
+        to the same cells.
+
+        :returns: dict of resolution in meters to (size_x, size_y)
+        """
+        g = self.grid
+        sel = select([g.c.resolution, g.c.size_x, g.c.size_y]).distinct()
+        sizes = {r: (x, y) for r, x, y in self.bind.execute(sel)}
+        if sizes:
+            return sizes
+
+        center = select([func.ST_Y(func.ST_Centroid(func.ST_Extent(self.table.c.geom)))]).where(located)
+        latitude = self.bind.execute(center).scalar()
+        if latitude is None:
+            return {}
+        return {r: get_size_in_degrees(r, latitude) for r in GRID_RESOLUTIONS}
 
     def _drop(self):
-        postgres_engine.execute("DROP TABLE IF EXISTS {};".format(self.name))
+        self.bind.execute("DROP TABLE IF EXISTS {};".format(self.name))
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._drop()
+        # After an error in a transaction the table goes with the rollback,
+        # and the aborted transaction would refuse the drop anyway.
+        if exc_type is None or self.bind is postgres_engine:
+            self._drop()
 
     def _geom_col(self):
         """
@@ -382,18 +622,71 @@ class Update(object):
         return geom_col
 
 
-def update_meta(metatable, table):
+class Deletion(Update):
+    """
+    Create a table (prefixed with d_) that contains the business key, geom,
+    and date of all records found in the existing table and no longer in the
+    staging table, so that they can be taken off the companion tables'
+    counts and deleted.
+    """
+    prefix = 'd_'
+    sign = -1
+
+    def _changed(self):
+        s = self.staging
+        e = self.existing
+
+        sel = select([e.c['hash'], e.c['point_date'], e.c['geom']])
+        return sel.select_from(e.outerjoin(s, e.c['hash'] == s.c['hash'])).\
+            where(s.c['hash'] == None)
+
+    def delete(self):
+        """
+        Take the absent records off the counts of the rollup, grid pyramid
+        and count cube, then delete them from the existing table.
+        """
+        self._update_rollup()
+        self._update_grid()
+        self._update_cube()
+
+        for table in (self.rollup, self.grid, self.cube):
+            try:
+                self.bind.execute(table.delete().where(table.c['count'] <= 0))
+            except Exception as e:
+                raise PlenarioETLError(repr(e) +
+                                       '\n Failed to clear empty counts from ' + table.name)
+
+        dele = self.existing.delete().where(self.existing.c.hash.in_(select([self.table.c.hash])))
+        try:
+            self.bind.execute(dele)
+        except Exception as e:
+            raise PlenarioETLError(repr(e) +
+                                   '\n Failed on statement: ' + str(dele))
+
+
+def _column_types(table):
+    """Names and types of the columns of a table that come from the source."""
+    return {c.name: str(c.type) for c in table.columns
+            if c.name not in {'geom', 'point_date', 'hash'}}
+
+
+def update_meta(metatable, table, source_version=None):
     """
     After ingest/update, update the metatable registry to reflect table information.
 
     :param metatable: MetaTable instance to update.
     :param table: Table instance to update from.
+    :param source_version: SourceVersion of the file the table was loaded from,
+                           None if it was a local file.
 
     :returns: None
     """
 
     metatable.update_date_added()
 
+    (metatable.source_etag, metatable.source_last_modified,
+     metatable.source_length, metatable.source_checksum) = source_version or SourceVersion(None, None, None, None)
+
     metatable.obs_from, metatable.obs_to = postgres_session.query(
         func.min(table.c.point_date),
         func.max(table.c.point_date)
@@ -401,7 +694,7 @@ def update_meta(metatable, table):
 
     metatable.bbox = postgres_session.query(
         func.ST_SetSRID(
-            func.ST_Envelope(func.ST_Union(table.c.geom)),
+            func.ST_Envelope(func.ST_Extent(table.c.geom)),
             4326
         )
     ).first()[0]
@@ -413,3 +706,6 @@ def update_meta(metatable, table):
 
     postgres_session.add(metatable)
     postgres_session.commit()
+
+    MetaTable.invalidate_catalog()
+    bump_dataset_version(metatable.dataset_name)
@@ -3,6 +3,7 @@ import zipfile
 from sqlalchemy.exc import ProgrammingError
 from plenario.database import postgres_engine, postgres_session
 from plenario.etl.common import ETLFile, add_unique_hash
+from plenario.utils.cache_versions import bump_dataset_version
 from plenario.utils.shapefile import import_shapefile
 
 
@@ -35,5 +36,7 @@ class ShapeETL:
         self.meta.update_after_ingest()
         postgres_session.commit()
 
+        bump_dataset_version(self.table_name)
+
     def update(self):
         self.add()
@@ -1,23 +1,78 @@
 import json
+import threading
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
 from collections import namedtuple
-from datetime import datetime
+from datetime import datetime, time, timedelta
 from hashlib import md5
 from itertools import groupby
 from operator import itemgetter
+from time import monotonic
 
 import sqlalchemy as sa
 from flask_bcrypt import Bcrypt
 from geoalchemy2 import Geometry
+from geoalchemy2.shape import to_shape
 from shapely.geometry import shape
-from sqlalchemy import Boolean, Column, Date, DateTime, String, Table, Text, func, select
+from shapely.prepared import prep
+from sqlalchemy import BigInteger, Boolean, Column, Date, DateTime, String, Text, func, select
 from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.exc import ProgrammingError
 
-from plenario.database import postgres_base, postgres_session
+from plenario.database import postgres_base, postgres_engine, postgres_session, table_registry
+from plenario.settings import CATALOG_TTL, TIMESERIES_WORKERS
+from plenario.utils.cache_versions import CATALOG, dataset_versions
+from plenario.utils.geom_cache import intersects_geom
 from plenario.utils.helpers import get_size_in_degrees, slugify
 
 bcrypt = Bcrypt()
 
+# Units of aggregation coarse enough to be answered from the daily rollups.
+ROLLUP_AGG_UNITS = {'day', 'week', 'month', 'quarter', 'year'}
+
+# Cell sizes, in meters, that the ETL precomputes grid counts for.
+GRID_RESOLUTIONS = (100, 250, 500, 1000, 2500, 5000)
+
+# Length of the geohashes that identify count cube cells. Six characters make
+# cells of roughly 1.2km by 0.6km.
+CUBE_PRECISION = 6
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    return datetime.combine(value, time())
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def _floor_day(value):
+    return datetime.combine(value.date(), time())
+
+
+def _full_days(start, end):
+    """Bounds of the whole days that lie within the inclusive range
+    [start, end], as a half open range [full_from, full_to)."""
+    full_from = _floor_day(start)
+    if full_from < start:
+        full_from += timedelta(days=1)
+    # end is inclusive, so a record at exactly midnight of the last day
+    # belongs to a partial day.
+    full_to = _floor_day(end)
+    return full_from, full_to
+
+
+def _bucket_days(agg_unit, *daily_counts):
+    """Sum selects of (day, count) rows into time buckets of agg_unit."""
+    days = sa.union_all(*daily_counts).alias('days')
+    return select([sa.cast(func.sum(days.c['count']), sa.Integer).label('count'),
+                   func.date_trunc(agg_unit, days.c.day).label('time_bucket')]) \
+        .group_by('time_bucket')
+
 
 class MetaTable(postgres_base):
     __tablename__ = 'meta_master'
@@ -49,6 +104,12 @@ class MetaTable(postgres_base):
     contributor_email = Column(String)
     result_ids = Column(ARRAY(String))
     column_names = Column(JSONB)  # {'<COLUMN_NAME>': '<COLUMN_TYPE>'}
+    # What the source looked like when it was last loaded,
+    # so that refreshes can skip sources that haven't changed.
+    source_etag = Column(String)
+    source_last_modified = Column(String)
+    source_length = Column(BigInteger)
+    source_checksum = Column(String(32))
 
     def __init__(self, url, human_name, observed_date,
                  approved_status=False, update_freq='yearly',
@@ -145,11 +206,31 @@ class MetaTable(postgres_base):
 
     @property
     def point_table(self):
-        try:
-            return self._point_table
-        except AttributeError:
-            self._point_table = Table(self.dataset_name, postgres_base.metadata, autoload=True, extend_existing=True)
-            return self._point_table
+        return table_registry.get(self.dataset_name, self.last_update)
+
+    @property
+    def rollup_table(self):
+        """The table of daily record counts kept alongside the point table by
+        the ETL, or None for datasets that have not been refreshed since
+        rollups were introduced."""
+        return self._companion_table('r_')
+
+    @property
+    def grid_table(self):
+        """The pyramid of daily grid cell counts kept alongside the point table
+        by the ETL, or None for datasets that have not been refreshed since
+        grid pyramids were introduced."""
+        return self._companion_table('g_')
+
+    @property
+    def cube_table(self):
+        """The daily geohash cell counts kept alongside the point table by the
+        ETL, or None for datasets that have not been refreshed since the count
+        cube was introduced."""
+        return self._companion_table('c_')
+
+    def _companion_table(self, prefix):
+        return table_registry.get(prefix + self.dataset_name, self.last_update, optional=True)
 
     @classmethod
     def attach_metadata(cls, rows):
@@ -207,6 +288,9 @@ class MetaTable(postgres_base):
             }
         ]
         """
+        if not table_names:
+            return []
+
         # For each table in table_names, generate a query to be unioned
         selects = []
         for name in table_names:
@@ -217,33 +301,31 @@ class MetaTable(postgres_base):
             ts_select = table.timeseries(agg_unit, start, end, geom, ctree)
             selects.append(ts_select)
 
-        # Union the time series selects to get a panel
-        panel_query = sa.union(*selects) \
-            .order_by('dataset_name') \
-            .order_by('time_bucket')
-        panel_vals = postgres_session.execute(panel_query)
+        if TIMESERIES_WORKERS > 1 and len(selects) > 1:
+            # Run each dataset's query on its own connection, so that postgres
+            # works on them at the same time rather than one after another.
+            results = _timeseries_executor().map(_fetch_timeseries, selects)
+            panel_vals = [row for rows in results for row in rows]
+            panel_vals.sort(key=lambda row: row.dataset_name)
+        else:
+            # Union the time series selects to get a panel
+            panel_query = sa.union(*selects) \
+                .order_by('dataset_name') \
+                .order_by('time_bucket')
+            panel_vals = postgres_session.execute(panel_query)
 
         panel = []
-        for dataset_name, ts in groupby(panel_vals, lambda row: row.dataset_name):
+        for dataset_name, rows in groupby(panel_vals, lambda row: row.dataset_name):
+            items = [{'datetime': row.time_bucket.date().isoformat(), 'count': row.count}
+                     for row in rows]
+            # Aggregate top-level count across all time slices.
+            total = sum(item['count'] for item in items)
 
-            # ts gets closed after it's been iterated over once,
-            # so we need to store the rows somewhere to iterate over them twice.
-            rows = [row for row in ts]
             # If no records were found, don't include this dataset
-            if all([row.count == 0 for row in rows]):
+            if total == 0:
                 continue
 
-            ts_dict = {'dataset_name': dataset_name,
-                       'items': []}
-
-            for row in rows:
-                ts_dict['items'].append({
-                    'datetime': row.time_bucket.date().isoformat(),
-                    'count': row.count
-                })
-                # Aggregate top-level count across all time slices.
-                ts_dict['count'] = sum([i['count'] for i in ts_dict['items']])
-            panel.append(ts_dict)
+            panel.append({'dataset_name': dataset_name, 'items': items, 'count': total})
 
         return panel
 
@@ -251,9 +333,7 @@ class MetaTable(postgres_base):
     @classmethod
     def index(cls):
         try:
-            q = postgres_session.query(cls.dataset_name)
-            q = q.filter(cls.approved_status == True)
-            names = [result.dataset_name for result in q.all()]
+            names = [meta.dataset_name for meta in _catalog.datasets() if meta.approved_status]
         except ProgrammingError:
             # Handles a case that causes init_db to crash.
             # Validator calls index when initializing, prevents this call
@@ -268,23 +348,29 @@ class MetaTable(postgres_base):
         :return names: Names of point datasets whose bounding box and date range
                        interesects with the given bounds.
         """
-        # Filter out datsets that don't intersect the time boundary
-        q = postgres_session.query(cls.dataset_name) \
-            .filter(cls.dataset_name.in_(dataset_names), cls.date_added != None,
-                    cls.obs_from < end,
-                    cls.obs_to > start)
+        candidates = _catalog.overlapping(start, end)
+        names = [name for name in dataset_names if name in candidates]
 
-        # or the geometry boundary
+        # Filter out datasets that don't intersect the geometry boundary
         if geom:
-            intersecting = cls.bbox.ST_Intersects(func.ST_GeomFromGeoJSON(geom))
-            q = q.filter(intersecting)
+            boundary = prep(shape(json.loads(geom)))
+            bboxes = _catalog.bboxes()
+            names = [name for name in names if name in bboxes and boundary.intersects(bboxes[name])]
 
-        return [row.dataset_name for row in q.all()]
+        return names
 
     @classmethod
     def get_by_dataset_name(cls, name):
-        foo = postgres_session.query(cls).filter(cls.dataset_name == name).first()
-        return foo
+        """Look up a dataset's metadata in the in-memory catalog. The record
+        returned is detached from any session, so treat it as read-only; query
+        for the row directly to make changes to it.
+        """
+        return _catalog.get(name)
+
+    @classmethod
+    def invalidate_catalog(cls):
+        """Make this process read meta_master again on the next lookup."""
+        _catalog.invalidate()
 
     def get_bbox_center(self):
         sel = select([func.ST_AsGeoJSON(func.ST_centroid(self.bbox))])
@@ -307,48 +393,103 @@ class MetaTable(postgres_base):
         :param conditions: conditions on columns to filter on
         :type conditions: list of SQLAlchemy binary operations
                           (e.g. col > value)
-        :return: grid: result proxy with all result rows
+        :return: grid: rows of (count, x, y) where x and y are the center
+                       of a grid square
                  size_x, size_y: the horizontal and vertical size
                                     of the grid squares in degrees
         """
+        q, size_x, size_y = self.grid_query(resolution, geom, conditions, obs_dates)
+        if q is None:
+            return [], None, None
+        return postgres_session.execute(q), size_x, size_y
+
+    def grid_query(self, resolution, geom=None, conditions=None, obs_dates={}):
+        """Build the select that make_grid runs, without running it.
+
+        :return: select of (count, x, y), or None if the dataset has no
+                 located records, and the size_x, size_y of the grid squares
+        """
         if conditions is None:
             conditions = []
 
+        if not conditions and geom is None and resolution in GRID_RESOLUTIONS \
+                and self.grid_table is not None:
+            g = self.grid_table
+            sizes = postgres_session.query(g.c.size_x, g.c.size_y) \
+                .filter(g.c.resolution == resolution) \
+                .first()
+            if sizes is not None:
+                size_x, size_y = sizes
+                return self._pyramid_cells(resolution, size_x, size_y, obs_dates), size_x, size_y
+
+        if self.bbox is None:
+            return None, None, None
+
         # We need to convert resolution (given in meters) to degrees
         # - which is the unit of measure for EPSG 4326 -
         # - in order to generate our grid.
-        center = self.get_bbox_center()
-        # center[1] is longitude
-        size_x, size_y = get_size_in_degrees(resolution, center[1])
+        latitude = to_shape(self.bbox).centroid.y
+        size_x, size_y = get_size_in_degrees(resolution, latitude)
 
+        return self._raw_cells(size_x, size_y, geom, conditions, obs_dates), size_x, size_y
+
+    def _raw_cells(self, size_x, size_y, geom=None, conditions=(), obs_dates={}, where=None):
+        """Count records per grid square by scanning the point table."""
         t = self.point_table
 
-        q = postgres_session.query(
-                func.count(t.c.hash),
-                func.ST_SnapToGrid(
-                    t.c.geom,
-                    0,
-                    0,
-                    size_x,
-                    size_y
-                ).label('squares')
-            ).filter(*conditions).group_by('squares')
+        squares = func.ST_SnapToGrid(t.c.geom, 0, 0, size_x, size_y)
+        x, y = func.ST_X(squares), func.ST_Y(squares)
+
+        q = select([func.count(t.c.hash).label('count'), x.label('x'), y.label('y')]) \
+            .where(sa.and_(t.c.geom != None, *conditions)) \
+            .group_by(x, y)
 
         if geom:
-            q = q.filter(t.c.geom.ST_Within(func.ST_GeomFromGeoJSON(geom)))
+            q = q.where(intersects_geom(t.c.geom, geom))
 
         if obs_dates:
-            q = q.filter(t.c.point_date >= obs_dates['lower'])
-            q = q.filter(t.c.point_date <= obs_dates['upper'])
+            q = q.where(t.c.point_date >= obs_dates['lower'])
+            q = q.where(t.c.point_date <= obs_dates['upper'])
 
-        return postgres_session.execute(q), size_x, size_y
+        if where is not None:
+            q = q.where(where)
+
+        return q
+
+    def _pyramid_cells(self, resolution, size_x, size_y, obs_dates={}):
+        """Count records per grid square by summing a level of the grid
+        pyramid. As with the daily rollups, records on partial days at either
+        end of the date range come from the point table."""
+        g = self.grid_table
+        level = select([g.c['count'], g.c.x, g.c.y]).where(g.c.resolution == resolution)
+
+        if not obs_dates:
+            cells = level.alias('cells')
+        else:
+            start, end = _as_datetime(obs_dates['lower']), _as_datetime(obs_dates['upper'])
+            full_from, full_to = _full_days(start, end)
+
+            if full_from >= full_to:
+                return self._raw_cells(size_x, size_y, obs_dates=obs_dates)
+
+            t = self.point_table
+            partial_days = sa.or_(
+                sa.and_(t.c.point_date >= start, t.c.point_date < full_from),
+                sa.and_(t.c.point_date >= full_to, t.c.point_date <= end)
+            )
+            cells = sa.union_all(
+                level.where(sa.and_(g.c.day >= full_from, g.c.day < full_to)),
+                self._raw_cells(size_x, size_y, where=partial_days)
+            ).alias('cells')
+
+        return select([sa.cast(func.sum(cells.c['count']), sa.Integer).label('count'), cells.c.x, cells.c.y]) \
+            .group_by(cells.c.x, cells.c.y)
 
     # Return select statement to execute or union
     def timeseries(self, agg_unit, start, end, geom=None, column_filters=None):
         # Reading this blog post
         # http://no0p.github.io/postgresql/2014/05/08/timeseries-tips-pg.html
         # inspired this implementation.
-        t = self.point_table
 
         # Special case for the 'quarter' unit of aggregation.
         step = '3 months' if agg_unit == 'quarter' else '1 ' + agg_unit
@@ -362,6 +503,34 @@ class MetaTable(postgres_base):
                            day_generator.label('time_bucket')]) \
             .alias('defaults')
 
+        if geom is None and column_filters is None and agg_unit in ROLLUP_AGG_UNITS \
+                and self.rollup_table is not None:
+            actuals = self._rollup_counts(agg_unit, start, end)
+        elif geom is not None and column_filters is None and agg_unit in ROLLUP_AGG_UNITS \
+                and self.cube_table is not None:
+            actuals = self._cube_counts(agg_unit, start, end, geom)
+        else:
+            actuals = self._raw_counts(agg_unit, start, end, geom, column_filters)
+
+        # Need to alias to make it usable in a subexpression
+        actuals = actuals.alias('actuals')
+
+        # Outer join the default and observed values
+        # to create the timeseries select statement.
+        # If no observed value in a bucket, use the default.
+        name = sa.literal_column("'{}'".format(self.dataset_name)) \
+            .label('dataset_name')
+        bucket = defaults.c.time_bucket.label('time_bucket')
+        count = func.coalesce(actuals.c.count, defaults.c.count).label('count')
+        ts = select([name, bucket, count]). \
+            select_from(defaults.outerjoin(actuals, actuals.c.time_bucket == defaults.c.time_bucket))
+
+        return ts
+
+    def _raw_counts(self, agg_unit, start, end, geom=None, column_filters=None):
+        """Count records per time bucket by scanning the point table."""
+        t = self.point_table
+
         where_filters = [t.c.point_date >= start, t.c.point_date <= end]
         if column_filters is not None:
             # Column filters has to be iterable here, because the '+' operator
@@ -380,26 +549,101 @@ class MetaTable(postgres_base):
 
         # Also filter by geometry if requested
         if geom:
-            contains = func.ST_Within(t.c.geom, func.ST_GeomFromGeoJSON(geom))
-            actuals = actuals.where(contains)
+            actuals = actuals.where(intersects_geom(t.c.geom, geom))
 
-        # Need to alias to make it usable in a subexpression
-        actuals = actuals.alias('actuals')
+        return actuals
 
-        # Outer join the default and observed values
-        # to create the timeseries select statement.
-        # If no observed value in a bucket, use the default.
-        name = sa.literal_column("'{}'".format(self.dataset_name)) \
-            .label('dataset_name')
-        bucket = defaults.c.time_bucket.label('time_bucket')
-        count = func.coalesce(actuals.c.count, defaults.c.count).label('count')
-        ts = select([name, bucket, count]). \
-            select_from(defaults.outerjoin(actuals, actuals.c.time_bucket == defaults.c.time_bucket))
+    def _rollup_counts(self, agg_unit, start, end):
+        """Count records per time bucket by summing the daily rollup. Only the
+        days that lie entirely within [start, end] are read from the rollup,
+        records on the partial days at either end come from the point table."""
+        t = self.point_table
+        r = self.rollup_table
 
-        return ts
+        start, end = _as_datetime(start), _as_datetime(end)
+        full_from, full_to = _full_days(start, end)
+
+        if full_from >= full_to:
+            return self._raw_counts(agg_unit, start, end)
+
+        full_days = select([r.c.day.label('day'), r.c['count'].label('count')]) \
+            .where(sa.and_(r.c.day >= full_from, r.c.day < full_to))
+
+        raw_day = func.date_trunc('day', t.c.point_date)
+        partial_days = select([raw_day.label('day'), func.count(t.c.hash).label('count')]) \
+            .where(sa.or_(
+                sa.and_(t.c.point_date >= start, t.c.point_date < full_from),
+                sa.and_(t.c.point_date >= full_to, t.c.point_date <= end)
+            )) \
+            .group_by(raw_day)
+
+        return _bucket_days(agg_unit, full_days, partial_days)
+
+    def _cube_counts(self, agg_unit, start, end, geom):
+        """Count records within a polygon per time bucket by summing the
+        count cube. Cells that the polygon covers entirely are summed as they
+        are. Only the records in cells along the polygon's boundary, and those
+        on the partial days at either end of [start, end], are read from the
+        point table and tested against the polygon."""
+        t = self.point_table
+        c = self.cube_table
+
+        start, end = _as_datetime(start), _as_datetime(end)
+        full_from, full_to = _full_days(start, end)
+
+        if full_from >= full_to:
+            return self._raw_counts(agg_unit, start, end, geom)
+
+        in_full_days = sa.and_(c.c.day >= full_from, c.c.day < full_to)
+        covered = func.ST_CoveredBy(c.c.geom, func.ST_GeomFromGeoJSON(geom))
+
+        inner_days = select([c.c.day.label('day'), c.c['count'].label('count')]) \
+            .where(sa.and_(in_full_days, covered))
+
+        boundary = select([c.c.cell, c.c.geom]) \
+            .where(sa.and_(
+                in_full_days,
+                func.ST_Intersects(c.c.geom, func.ST_GeomFromGeoJSON(geom)),
+                sa.not_(covered)
+            )) \
+            .distinct() \
+            .alias('boundary')
+
+        raw_day = func.date_trunc('day', t.c.point_date)
+        within = intersects_geom(t.c.geom, geom)
+
+        # The && test lets the spatial index find the candidate points of each
+        # boundary cell, the geohash places each point in exactly one cell.
+        boundary_days = select([raw_day.label('day'), func.count(t.c.hash).label('count')]) \
+            .select_from(t.join(boundary, t.c.geom.op('&&')(boundary.c.geom))) \
+            .where(sa.and_(
+                func.ST_GeoHash(t.c.geom, CUBE_PRECISION) == boundary.c.cell,
+                t.c.point_date >= full_from,
+                t.c.point_date < full_to,
+                within
+            )) \
+            .group_by(raw_day)
+
+        partial_days = select([raw_day.label('day'), func.count(t.c.hash).label('count')]) \
+            .where(sa.and_(
+                sa.or_(
+                    sa.and_(t.c.point_date >= start, t.c.point_date < full_from),
+                    sa.and_(t.c.point_date >= full_to, t.c.point_date <= end)
+                ),
+                within
+            )) \
+            .group_by(raw_day)
+
+        return _bucket_days(agg_unit, inner_days, boundary_days, partial_days)
 
     def timeseries_one(self, agg_unit, start, end, geom=None, column_filters=None):
         ts_select = self.timeseries(agg_unit, start, end, geom, column_filters)
+        return self.timeseries_rows(ts_select)
+
+    @staticmethod
+    def timeseries_rows(ts_select):
+        """Run a select made by timeseries and return the table of its rows,
+        as timeseries_one does."""
         rows = postgres_session.execute(ts_select.order_by('time_bucket'))
 
         header = [['count', 'datetime']]
@@ -425,3 +669,133 @@ class MetaTable(postgres_base):
             WHERE m.approved_status = 'true'
         """
         return list(postgres_session.execute(query))
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _timeseries_executor():
+    """Thread pool shared by every /timeseries request in this process, which
+    also caps how many connections they hold at once."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=TIMESERIES_WORKERS)
+        return _executor
+
+
+def _fetch_timeseries(ts_select):
+    with postgres_engine.connect() as connection:
+        return connection.execute(ts_select.order_by('time_bucket')).fetchall()
+
+
+class _Catalog(object):
+    """Per-process copy of every meta_master record, so that looking up a
+    dataset's metadata doesn't cost a query. The copy is read again once it is
+    older than CATALOG_TTL, or as soon as the catalog version stamp shows that
+    an ETL run somewhere has changed a dataset.
+    """
+
+    # Seconds between checks of the catalog version stamp in redis.
+    stamp_interval = 1
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._state = _CatalogState({})
+        self._loaded_at = None
+        self._stamp = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        return self._current().records.get(name)
+
+    def datasets(self):
+        return list(self._current().records.values())
+
+    def overlapping(self, start, end):
+        """Names of the ingested datasets whose observations could fall
+        between start and end, inclusive."""
+        return self._current().overlapping(start, end)
+
+    def bboxes(self):
+        """Bounding boxes of the ingested datasets as shapely geometries."""
+        return self._current().bboxes
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _current(self):
+        if not self._is_stale():
+            return self._state
+
+        with self._lock:
+            if self._is_stale():
+                self._load()
+            return self._state
+
+    def _is_stale(self):
+        now = monotonic()
+        if self._loaded_at is None or now - self._loaded_at > self.ttl:
+            return True
+        if now - self._checked_at > self.stamp_interval:
+            self._checked_at = now
+            return self._catalog_stamp() != self._stamp
+        return False
+
+    @staticmethod
+    def _catalog_stamp():
+        try:
+            [(_, stamp)] = dataset_versions([CATALOG])
+            return stamp
+        except Exception:
+            # Without redis, fall back on the TTL alone.
+            return None
+
+    def _load(self):
+        stamp = self._catalog_stamp()
+        # Use a session of our own, so that the records can be detached
+        # without disturbing the request's session.
+        session = postgres_session.session_factory()
+        try:
+            records = {}
+            for meta in session.query(MetaTable).all():
+                records.setdefault(meta.dataset_name, meta)
+            session.expunge_all()
+        finally:
+            session.close()
+
+        self._state = _CatalogState(records)
+        self._stamp = stamp
+        self._loaded_at = self._checked_at = monotonic()
+
+
+class _CatalogState(object):
+    """One load of the catalog, with the records indexed by their extents.
+    Built all at once and never changed, so readers can share it freely."""
+
+    def __init__(self, records):
+        self.records = records
+
+        # Ingested datasets ordered by the start of their observations, so
+        # that everything starting after some date can be cut off by bisection.
+        ingested = sorted(
+            (meta for meta in records.values()
+             if meta.date_added is not None and meta.obs_from is not None and meta.obs_to is not None),
+            key=lambda meta: meta.obs_from
+        )
+        self._starts = [meta.obs_from for meta in ingested]
+        self._ingested = ingested
+
+        self.bboxes = {meta.dataset_name: to_shape(meta.bbox)
+                       for meta in ingested if meta.bbox is not None}
+
+    def overlapping(self, start, end):
+        start, end = _as_date(start), _as_date(end)
+        began_in_time = self._ingested[:bisect_right(self._starts, end)]
+        return {meta.dataset_name for meta in began_in_time if meta.obs_to >= start}
+
+
+_catalog = _Catalog(CATALOG_TTL)
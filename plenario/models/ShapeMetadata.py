@@ -6,7 +6,8 @@ from sqlalchemy import Boolean, Column, Date, Integer, String, Table, Text, func
 from sqlalchemy.exc import NoSuchTableError
 from sqlalchemy.types import NullType
 
-from plenario.database import postgres_base, postgres_session
+from plenario.database import postgres_base, postgres_session, table_registry
+from plenario.utils.cache_versions import dataset_versions
 from plenario.utils.helpers import slugify
 
 bcrypt = Bcrypt()
@@ -216,11 +217,14 @@ class ShapeMetadata(postgres_base):
 
     @property
     def shape_table(self):
+        # Shapes carry no update time of their own, so use the stamp the ETL
+        # bumps whenever it reloads a shape table.
         try:
-            return self._shape_table
-        except AttributeError:
-            self._shape_table = Table(self.dataset_name, postgres_base.metadata, autoload=True, extend_existing=True)
-            return self._shape_table
+            [(_, version)] = dataset_versions([self.dataset_name])
+        except Exception:
+            table_registry.invalidate(self.dataset_name)
+            version = None
+        return table_registry.get(self.dataset_name, version)
 
     def remove_table(self):
         if self.is_ingested:
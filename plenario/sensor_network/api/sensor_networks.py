@@ -13,8 +13,8 @@ from shapely import wkb
 from sqlalchemy import MetaData, and_, asc, desc, func as sqla_fn
 from sqlalchemy.orm.exc import NoResultFound
 
-from plenario.api.common import cache, crossdomain, extract_first_geometry_fragment, make_cache_key, make_fragment_str, \
-    unknown_object_json_handler
+from plenario.api.common import cache, crossdomain, extract_first_geometry_fragment, make_fragment_str, \
+    make_validated_cache_key, unknown_object_json_handler
 from plenario.api.condition_builder import parse_tree
 from plenario.api.validator import valid_tree
 from plenario.database import redshift_base, redshift_engine, redshift_session
@@ -484,7 +484,7 @@ def get_observations_download(network: str) -> Response:
     return attachment
 
 
-@cache.cached(timeout=CACHE_TIMEOUT, key_prefix=make_cache_key)
+@cache.cached(timeout=CACHE_TIMEOUT, key_prefix=make_validated_cache_key(AggregateValidator, versioned=False))
 @crossdomain(origin='*')
 def get_aggregations(network: str) -> Response:
     '''Aggregate individual node observations up to larger units of time.
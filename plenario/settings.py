@@ -35,11 +35,64 @@ REDIS_HOST = get('REDIS_HOST', 'localhost')
 # See: https://pythonhosted.org/Flask-Cache/#configuring-flask-cache
 # for config options
 CACHE_CONFIG = {
-    'CACHE_TYPE': 'redis',
+    'CACHE_TYPE': 'plenario.api.caching.tiered_redis',
     'CACHE_REDIS_HOST': REDIS_HOST,
-    'CACHE_KEY_PREFIX': get('CACHE_KEY_PREFIX', 'plenario_app')
+    'CACHE_KEY_PREFIX': get('CACHE_KEY_PREFIX', 'plenario_app'),
+    # Entries each process keeps in memory in front of redis, and for how
+    # many seconds. Only entries up to CACHE_LOCAL_MAX_SIZE bytes are kept.
+    'CACHE_LOCAL_ITEMS': int(get('CACHE_LOCAL_ITEMS', 256)),
+    'CACHE_LOCAL_TTL': int(get('CACHE_LOCAL_TTL', 5)),
+    'CACHE_LOCAL_MAX_SIZE': int(get('CACHE_LOCAL_MAX_SIZE', 64 * 1024)),
+    # Entries from CACHE_COMPRESS_MIN_SIZE bytes are stored compressed, those
+    # over CACHE_MAX_SIZE bytes are not cached at all.
+    'CACHE_COMPRESS_MIN_SIZE': int(get('CACHE_COMPRESS_MIN_SIZE', 16 * 1024)),
+    'CACHE_MAX_SIZE': int(get('CACHE_MAX_SIZE', 2 * 1024 * 1024))
 }
 
+# Seconds that identical requests missing the cache at the same time wait for
+# the first of them to compute and cache the response, before giving up and
+# computing it themselves.
+CACHE_FLIGHT_TIMEOUT = int(get('CACHE_FLIGHT_TIMEOUT', 30))
+
+# Upper bound on the number of connections a single /datadump request may
+# read from at once when it asks for a parallel export.
+EXPORT_MAX_PARALLEL = int(get('EXPORT_MAX_PARALLEL', 4))
+# Connections set aside for parallel exports, separate from the pool that
+# serves other requests. An export takes one more than its number of slices,
+# and waits for them if other exports are using the pool.
+EXPORT_POOL_SIZE = max(int(get('EXPORT_POOL_SIZE', 10)), EXPORT_MAX_PARALLEL + 1)
+
+# Seconds that each process keeps its in-memory copy of meta_master before
+# reading it again. ETL runs also refresh it as soon as they finish.
+CATALOG_TTL = int(get('CATALOG_TTL', 60))
+
+# Threads per process for running the per-dataset queries of a /timeseries
+# request side by side. Set to 1 to send them as a single UNION instead.
+TIMESERIES_WORKERS = int(get('TIMESERIES_WORKERS', 4))
+
+# Where results of job=true requests are written. Web servers and celery
+# workers must all see the same directory. Results are split into gzipped
+# pages of about JOB_PAGE_SIZE bytes and removed after JOB_TTL seconds.
+JOBS_DIR = get('JOBS_DIR', DATA_DIR + '/jobs')
+JOB_PAGE_SIZE = int(get('JOB_PAGE_SIZE', 4 * 1024 * 1024))
+JOB_TTL = int(get('JOB_TTL', 24 * 60 * 60))
+
+# Planner cost above which /detail, /detail-aggregate and /grid requests are
+# not run inline. With QUERY_COST_ACTION 'job' they are handed to a celery
+# worker as if made with job=true, with 'reject' they get a 400 and a hint.
+# A limit of 0 turns the check off.
+QUERY_COST_LIMIT = float(get('QUERY_COST_LIMIT', 0))
+QUERY_COST_ACTION = get('QUERY_COST_ACTION', 'job')
+
+# Seconds that the subdivided pieces of a geometry used in a spatial filter
+# are kept after it was last used.
+GEOM_CACHE_TTL = int(get('GEOM_CACHE_TTL', 7 * 24 * 60 * 60))
+
+# Rows of a source file read to infer its column types when a dataset is
+# first ingested. 0 reads the whole file, which is the only way to be sure
+# that a rare value further down does not break the inferred type.
+INFERENCE_MAX_ROWS = int(get('INFERENCE_MAX_ROWS', 0))
+
 # Load a default admin
 DEFAULT_USER = {
     'name': get('DEFAULT_USER_NAME', 'Plenario Admin'),
@@ -15,6 +15,7 @@ from plenario.etl.point import PlenarioETL
 from plenario.etl.shape import ShapeETL
 from plenario.models import MetaTable, ShapeMetadata
 from plenario.settings import CELERY_BROKER_URL, S3_BUCKET, PLENARIO_SENTRY_URL, CELERY_RESULT_BACKEND
+from plenario.utils.cache_versions import bump_dataset_version
 from plenario.utils.helpers import reflect
 from plenario.utils.weather import WeatherETL
 
@@ -29,6 +30,9 @@ worker = Celery(
 
 logger = logging.getLogger(__name__)
 
+# Flask app that job=true requests are run against, made on first use.
+_job_app = None
+
 
 def get_meta(name: str):
     """Return meta record given a point table name or a shape table name.
@@ -56,6 +60,29 @@ def health() -> bool:
     return True
 
 
+@worker.task()
+def run_job(ticket: str, url: str) -> bool:
+    """Run an API request that was made with job=true and store its response
+    for the /jobs endpoint.
+    """
+    global _job_app
+    from plenario.api.common import cache
+    from plenario.api.jobs import execute_job
+    from plenario.server import create_app
+
+    logger.info('Begin. (ticket: "{}", url: "{}")'.format(ticket, url))
+    if _job_app is None:
+        _job_app = create_app()
+        # Jobs are where expensive queries are sent to run.
+        _job_app.config['QUERY_COST_LIMIT'] = 0
+        # Replays share their cache keys with the requests that queued them,
+        # so with the shared cache a job could be answered with its own ticket.
+        cache.init_app(_job_app, config={'CACHE_TYPE': 'null', 'CACHE_NO_NULL_WARNING': True})
+    execute_job(_job_app, ticket, url)
+    logger.info('End.')
+    return True
+
+
 @worker.task()
 def add_dataset(name: str) -> bool:
     """Ingest the row information for an approved point dataset.
@@ -86,6 +113,8 @@ def delete_dataset(name: str) -> bool:
     metatable = reflect("meta_master", postgres_base.metadata, postgres_engine)
     metatable.delete().where(metatable.c.dataset_name == name).execute()
     reflect(name, postgres_base.metadata, postgres_engine).drop()
+    postgres_engine.execute('drop table if exists r_{0}, g_{0}, c_{0}'.format(name))
+    bump_dataset_version(name)
     logger.info('End.')
     return True
 
@@ -125,6 +154,7 @@ def delete_shape(name) -> bool:
     metashape.delete().where(metashape.c.dataset_name == name).execute()
     logger.debug('Reflect and drop the corresponding shape table.')
     reflect(name, postgres_base.metadata, postgres_engine).drop()
+    bump_dataset_version(name)
     logger.info('End.')
     return True
 
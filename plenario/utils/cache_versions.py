@@ -0,0 +1,72 @@
+"""Version stamps for the datasets behind cached API responses.
+
+Cache keys for dataset queries include the current version stamp of each
+dataset the query touches. When the ETL refreshes a dataset it bumps that
+dataset's stamp, which orphans only the cached responses built from the old
+data; entries for every other dataset stay warm. Orphaned entries are never
+read again and age out with the cache timeout.
+
+The stamps live in redis rather than in the process so that a bump from a
+celery worker is seen by every web server at once.
+"""
+
+import logging
+from datetime import datetime
+
+from werkzeug.contrib.cache import RedisCache
+
+from plenario.settings import CACHE_CONFIG, REDIS_HOST
+
+
+logger = logging.getLogger(__name__)
+
+# Stamp for queries that do not name a dataset, and so may draw on any of them
+# (for example a timeseries across every dataset, or the dataset listing).
+CATALOG = '__all__'
+
+_versions = RedisCache(
+    host=REDIS_HOST,
+    key_prefix='{}_version_'.format(CACHE_CONFIG['CACHE_KEY_PREFIX']),
+    default_timeout=0
+)
+
+
+def _new_stamp():
+    return datetime.now().strftime('%Y%m%d%H%M%S%f')
+
+
+def dataset_versions(names):
+    """Look up the version stamps for a set of datasets in one round trip.
+    Datasets that have never been bumped are given a stamp on the spot.
+
+    :param names: iterable of dataset names
+    :returns: list of (name, stamp) tuples, sorted by name
+    """
+    names = sorted(set(names))
+    stamps = _versions.get_many(*names)
+
+    versions = []
+    for name, stamp in zip(names, stamps):
+        if stamp is None:
+            # SET NX so that concurrent first lookups agree on one stamp. Not
+            # _versions.add, which follows SETNX with an EXPIRE that deletes
+            # the key again when there is no timeout.
+            key = _versions.key_prefix + name
+            _versions._client.set(key, _versions.dump_object(_new_stamp()), nx=True)
+            stamp = _versions.get(name)
+        versions.append((name, stamp))
+    return versions
+
+
+def bump_dataset_version(name):
+    """Mark the cached responses for a dataset, and for the catalog as a
+    whole, as out of date. Failing to reach redis is logged and ignored, a
+    missed bump only means serving the old data until the cache times out.
+
+    :param name: dataset name
+    """
+    stamp = _new_stamp()
+    try:
+        _versions.set_many({name: stamp, CATALOG: stamp})
+    except Exception as exc:
+        logger.warning('Could not bump cache version for {}: {}'.format(name, exc))
@@ -0,0 +1,134 @@
+"""Subdivided copies of the geometries that users filter by.
+
+A detailed polygon, like a ward or community area boundary, can have
+thousands of vertices, which makes every point-in-polygon test against it
+expensive. The first time a geometry is used it is cut with ST_Subdivide
+into small pieces and stored in an unlogged table under the digest of its
+normalized GeoJSON. Spatial filters then test each point against the few
+pieces whose bounding boxes it falls in, which the spatial index finds
+quickly and which are each cheap to test.
+
+The pieces are only a cache, and are stored ahead of the query by the
+validator (see store_geom) rather than while the query is being built. An
+unlogged table is emptied if postgres crashes, and stored pieces may be
+pruned, so filters fall back to testing against the whole geometry when its
+pieces are missing. Each geometry's pieces record when they were last used,
+and whenever a new geometry is stored the pieces of geometries unused for
+GEOM_CACHE_TTL seconds are removed. The table is created by manage.py init
+along with the other metadata tables.
+"""
+
+import json
+import logging
+from datetime import timedelta
+from hashlib import md5
+
+from geoalchemy2 import Geometry
+from sqlalchemy import Column, DateTime, String, Table, and_, exists, func, literal, not_, or_, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from plenario.database import postgres_base, postgres_engine
+from plenario.settings import GEOM_CACHE_TTL
+
+
+logger = logging.getLogger(__name__)
+
+# Most vertices a stored piece may have.
+MAX_VERTICES = 64
+# Seconds between updates of the last_used time of a geometry's pieces, so
+# that a geometry in constant use is not written on every request.
+TOUCH_INTERVAL = 60 * 60
+
+geom_pieces = Table(
+    'geom_pieces', postgres_base.metadata,
+    Column('digest', String(32), nullable=False, index=True),
+    Column('geom', Geometry('GEOMETRY', srid=4326), nullable=False),
+    Column('last_used', DateTime(timezone=True), nullable=False, server_default=func.now(), index=True),
+    prefixes=['UNLOGGED']
+)
+
+def geom_digest(geom):
+    """Digest of a GeoJSON geometry that is the same for every spelling of it.
+
+    :param geom: GeoJSON geometry fragment
+    :type geom: str
+    """
+    normalized = json.dumps(json.loads(geom), sort_keys=True, separators=(',', ':'))
+    return md5(normalized.encode('utf-8')).hexdigest()
+
+
+def _lock_key(digest):
+    # Advisory locks take a bigint, 60 bits of the digest are plenty.
+    return int(digest[:15], 16)
+
+
+def store_geom(geom):
+    """Make sure the pieces of a geometry are stored, and return its digest.
+    Called once per request, before any query that filters by the geometry
+    is built. A database that can't be written to, like a read only replica,
+    only means the filters test against the whole geometry instead.
+
+    :param geom: GeoJSON geometry fragment
+    :type geom: str
+    """
+    digest = geom_digest(geom)
+
+    # Touch the pieces before checking for them. Taking their row locks
+    # keeps prune_geoms from removing them while they are about to be used.
+    touch = geom_pieces.update().where(and_(
+        geom_pieces.c.digest == digest,
+        geom_pieces.c.last_used < func.now() - timedelta(seconds=TOUCH_INTERVAL)
+    )).values(last_used=func.now())
+
+    pieces = select([
+        literal(digest),
+        func.ST_Subdivide(func.ST_GeomFromGeoJSON(geom), MAX_VERTICES)
+    ]).where(not_(exists().where(geom_pieces.c.digest == digest)))
+
+    try:
+        with postgres_engine.begin() as connection:
+            # Requests storing the same geometry at once take turns, so that
+            # the later ones see the pieces of the first instead of adding
+            # their own.
+            connection.execute(select([func.pg_advisory_xact_lock(_lock_key(digest))]))
+            connection.execute(touch)
+            stored = connection.execute(geom_pieces.insert().from_select(['digest', 'geom'], pieces))
+        if stored.rowcount:
+            prune_geoms()
+    except SQLAlchemyError:
+        logger.exception('Could not store the pieces of geometry {}.'.format(digest))
+    return digest
+
+
+def prune_geoms(ttl=GEOM_CACHE_TTL):
+    """Remove the pieces of geometries that have not been used in ttl seconds.
+
+    :param ttl: seconds since its last use after which a geometry is removed
+    """
+    expired = geom_pieces.c.last_used < func.now() - timedelta(seconds=ttl)
+    postgres_engine.execute(geom_pieces.delete().where(expired))
+
+
+def intersects_geom(column, geom):
+    """Condition that a geometry column intersects a user supplied geometry,
+    tested against its stored pieces. For points this is ST_Within, except
+    that points lying exactly on the outline also count as inside.
+
+    The condition only reads the pieces, store_geom must have been called
+    for them to be used. Without them it tests against the whole geometry.
+    Either way the && test against the geometry's bounding box lets the
+    column's spatial index pick out the candidate rows.
+
+    :param column: geometry column to filter
+    :param geom: GeoJSON geometry fragment
+    :type geom: str
+    """
+    digest = geom_digest(geom)
+    shape = func.ST_GeomFromGeoJSON(geom)
+    p = geom_pieces.alias('pieces')
+    stored = exists().where(p.c.digest == digest)
+    in_pieces = exists().where(and_(p.c.digest == digest, func.ST_Intersects(column, p.c.geom)))
+    return and_(
+        column.op('&&')(func.ST_Envelope(shape)),
+        or_(in_pieces, and_(not_(stored), func.ST_Intersects(column, shape)))
+    )
@@ -1,13 +1,16 @@
 import csv
+import itertools
 import math
+import threading
 from collections import namedtuple
 
 import boto3
 from slugify import slugify as _slugify
 from sqlalchemy import Table
+from sqlalchemy.exc import NoSuchTableError
 
 from plenario.settings import ADMIN_EMAILS, AWS_ACCESS_KEY, AWS_REGION_NAME, AWS_SECRET_KEY, MAIL_USERNAME
-from plenario.utils.typeinference import normalize_column_type
+from plenario.utils.typeinference import ColumnTypeInference
 
 
 def get_size_in_degrees(meters, latitude):
@@ -27,45 +30,38 @@ def get_size_in_degrees(meters, latitude):
 ColumnInfo = namedtuple('ColumnInfo', 'name type_ has_nulls')
 
 
-def infer_csv_columns(inp):
+def infer_csv_columns(inp, max_rows=None):
     """
     :param inp: File handle to a CSV dataset that we can throw into a UnicodeCSVReader
+    :param max_rows: if given, infer types from only this many rows
     :return: List of `ColumnInfo`s
     """
-    reader = csv.reader(inp)
-    header = next(reader)
-    inp.seek(0)
-    iter_output = [iter_column(col_idx, inp)
-                   for col_idx in range(len(header))]
-
+    header, iter_output = iter_columns(inp, max_rows)
     return [ColumnInfo(name, type_, has_nulls)
             for name, (type_, has_nulls) in zip(header, iter_output)]
 
 
-def iter_column(idx, f):
-    """
-    :param idx: index of column
-    :param f: gzip file object of CSV dataset
-    :return: col_type, null_values
+def iter_columns(f, max_rows=None):
+    """Infer the type of every column of a CSV in a single pass over it.
+
+    :param f: file object of CSV dataset
+    :param max_rows: if given, infer types from only this many rows
+    :return: header, [(col_type, null_values), ...]
              where col_type is inferred type from typeinference.py
              and null_values is whether null values were found and normalized.
     """
     f.seek(0)
     reader = csv.reader(f)
+    header = next(reader)
 
-    # Discard the header
-    next(reader)
+    columns = [ColumnTypeInference() for _ in header]
+    for row in itertools.islice(reader, max_rows):
+        # Rows short of values are bad data, their missing cells are skipped
+        # and values past the header are ignored.
+        for inference, value in zip(columns, row):
+            inference.add(value)
 
-    col = []
-    for row in reader:
-        if row:
-            try:
-                col.append(row[idx])
-            except IndexError:
-                # Bad data. Maybe we can fill with nulls?
-                pass
-    col_type, null_values = normalize_column_type(col)
-    return col_type, null_values
+    return header, [inference.result() for inference in columns]
 
 
 def slugify(text: str, delimiter: str = '_') -> str:
@@ -127,3 +123,59 @@ def reflect(table_name, metadata, engine):
         autoload=True,
         autoload_with=engine
     )
+
+
+class TableRegistry(object):
+    """Process-wide store of reflected tables. Each table is reflected once per
+    version of the dataset it holds, instead of once per request. Callers pass
+    a version stamp that changes whenever the ETL may have changed the table,
+    such as the dataset's last update time, and a table whose stamp no longer
+    matches is reflected again.
+    """
+
+    def __init__(self, metadata, engine):
+        """
+        :param metadata: (MetaData) collection to reflect tables into
+        :param engine: (Engine) SQLAlchemy object to send queries to the database
+        """
+        self.metadata = metadata
+        self.engine = engine
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def get(self, table_name, version=None, optional=False):
+        """
+        :param table_name: (str) table name
+        :param version: stamp identifying the current version of the table
+        :param optional: (bool) return None for a missing table instead of
+                         raising NoSuchTableError
+        :returns: (Table) SQLAlchemy object
+        """
+        entry = self._tables.get(table_name)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        with self._lock:
+            entry = self._tables.get(table_name)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+
+            # Let go of the stale definition so reflection starts from scratch
+            # rather than merging into the old columns.
+            if table_name in self.metadata.tables:
+                self.metadata.remove(self.metadata.tables[table_name])
+
+            try:
+                table = Table(table_name, self.metadata, autoload=True, autoload_with=self.engine)
+            except NoSuchTableError:
+                if not optional:
+                    raise
+                table = None
+
+            self._tables[table_name] = (version, table)
+            return table
+
+    def invalidate(self, table_name):
+        """Forget a table, so that the next lookup reflects it again."""
+        with self._lock:
+            self._tables.pop(table_name, None)
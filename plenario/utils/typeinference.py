@@ -1,11 +1,10 @@
 import datetime
+import re
 
 from dateutil.parser import parse
 from sqlalchemy import BigInteger, Boolean, Date, Float, Integer, String
 from sqlalchemy.dialects.postgresql import TIME, TIMESTAMP
 
-NoneType = type(None)
-
 NULL_VALUES = ('na', 'n/a', 'none', 'null', '.', '', ' ')
 TRUE_VALUES = ('yes', 'y', 'true', 't',)
 FALSE_VALUES = ('no', 'n', 'false', 'f',)
@@ -15,134 +14,221 @@ NULL_DATE = datetime.date(2999, 12, 31)
 NULL_TIME = datetime.time(0, 0, 0)
 
 
-def normalize_column_type(l):
-    """Given a sequence of values in a column (l),
-    guess its type.
+_TIME_24 = r'(?P<hour>\d{1,2}):(?P<minute>\d{2})(?::(?P<second>\d{2})(?:\.(?P<fraction>\d{1,6}))?)?'
+_TIME_12 = r'(?P<hour>0?[1-9]|1[0-2]):(?P<minute>\d{2})(?::(?P<second>\d{2}))? ?(?P<ampm>[AaPp][Mm])'
 
-    :param l: A column
-    :return: (col_type, null_values)
-             where col_type is a SQLAlchemy TypeEngine
-             and null_values is a boolean
-             representing whether nulls of any kind were detected.
-    """
-    null_values = False
+# The formats most date columns are written in. A value that matches one of
+# them is parsed without dateutil, anything else is left to dateutil.
+DATE_FORMATS = [re.compile(p, re.ASCII) for p in (
+    # ISO 8601 and Socrata's 2016-01-31T13:45:00.000
+    r'(?P<year>\d{4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})(?:[T ]' + _TIME_24 + ')?',
+    # 01/31/2016 01:45:00 PM
+    r'(?P<month>\d{1,2})/(?P<day>\d{1,2})/(?P<year>\d{4}) ' + _TIME_12,
+    # 01/31/2016 13:45:00
+    r'(?P<month>\d{1,2})/(?P<day>\d{1,2})/(?P<year>\d{4})(?: ' + _TIME_24 + ')?',
+    _TIME_24,
+    _TIME_12,
+)]
 
-    # Convert "NA", "N/A", etc. to null types.
-    for i, x in enumerate(l):
-        if x is not None and x.lower() in NULL_VALUES:
-            l[i] = None
-            null_values = True
 
-    # Are they boolean?
-    try:
-        for i, x in enumerate(l):
-            if x == '' or x is None:
-                raise ValueError('Not boolean')
-            elif x.lower() in TRUE_VALUES:
-                continue
-            elif x.lower() in FALSE_VALUES:
-                continue
-            else:
-                raise ValueError('Not boolean')
+def parse_known_format(x, date_format=None):
+    """Parse a value written in one of DATE_FORMATS, to the same datetime that
+    dateutil's parse(x, default=DEFAULT_DATETIME) would give.
 
-        return Boolean, null_values
-    except ValueError:
-        pass
+    :param x: value to parse
+    :param date_format: format to try before the others
+    :return: (datetime, format), or (None, None) if it is in no known format
+             or is not a valid date
+    """
+    formats = DATE_FORMATS if date_format is None else [date_format] + DATE_FORMATS
+    for date_format in formats:
+        match = date_format.fullmatch(x)
+        if match is not None:
+            break
+    else:
+        return None, None
+
+    fields = match.groupdict()
+    hour = int(fields['hour'] or 0)
+    if fields.get('ampm'):
+        hour = hour % 12 + (12 if fields['ampm'].lower() == 'pm' else 0)
 
-    # Are they integers?
     try:
-        normal_types_set = set()
-        add = normal_types_set.add
-        for i, x in enumerate(l):
-            if x == '' or x is None:
-                continue
-
-            int_x = int(x.replace(',', ''))
-
-            if x[0] == '0' and int(x) != 0:
-                raise TypeError('Integer is padded with 0s, so treat it as a string instead.')
-            if x.isspace():
-                raise TypeError('Integer is nothing but spaces so falling back to string')
-
-            if 9000000000000000000 > int_x > 1000000000:
-                add(BigInteger)
-            elif 1000000000 > int_x:
-                add(Integer)
-            else:
-                raise ValueError
-
-        if BigInteger in normal_types_set:
-            return BigInteger, null_values
-        else:
-            return Integer, null_values
-
-    except TypeError:
-        pass
+        d = datetime.datetime(
+            int(fields.get('year') or DEFAULT_DATETIME.year),
+            int(fields.get('month') or DEFAULT_DATETIME.month),
+            int(fields.get('day') or DEFAULT_DATETIME.day),
+            hour,
+            int(fields['minute'] or 0),
+            int(fields['second'] or 0),
+            int((fields.get('fraction') or '0').ljust(6, '0'))
+        )
     except ValueError:
-        pass
+        # Out of range, possibly because dateutil would read it another way,
+        # like 31/01/2016 as day first.
+        return None, None
+    return d, date_format
 
-    # Are they floats?
-    try:
 
-        for i, x in enumerate(l):
-            if x == '' or x is None:
-                continue
+# Most distinct numeric looking values held back from date parsing while the
+# column may still turn out to be numeric.
+MAX_DEFERRED_DATES = 1024
 
-            float_x = float(x.replace(',', ''))
 
-        return Float, null_values
-    except ValueError:
-        pass
+class ColumnTypeInference(object):
+    """Guesses the type of a column from its values one at a time, so that a
+    column can be inferred while streaming through a file without holding it.
 
-    # Are they datetimes?
-    try:
-        normal_types_set = set()
-        add = normal_types_set.add
-        ampm = False
-        for i, x in enumerate(l):
-            if x == '' or x is None:
-                add(NoneType)
-                continue
+    Each candidate type, from boolean through integer, float and date or time
+    to string, is tracked at once and dropped as soon as a value rules it out.
+    The result does not depend on the order of the values.
+    Numbers rarely matter to the date candidate, so parsing them as dates is
+    put off, for up to MAX_DEFERRED_DATES distinct values, until the column
+    is known not to be numeric.
+    """
 
-            d = parse(x, default=DEFAULT_DATETIME)
+    def __init__(self):
+        self.null_values = False
+        self.is_bool = True
+        self.is_int = True
+        self.is_bigint = False
+        self.is_float = True
+        self.is_date = True
+        self.date_types = set()
+        self.ampm = False
+        self.date_format = None
+        self.deferred = set()
+
+    def add(self, x):
+        """Take the next value of the column into account.
+
+        :param x: value from the column, None if it is missing
+        :type x: str
+        """
+        if x is not None and x.lower() in NULL_VALUES:
+            x = None
+            self.null_values = True
 
-            # Is it only a time?
-            if d.date() == NULL_DATE:
-                add(TIME)
+        if self.is_bool:
+            self.is_bool = x is not None and (x.lower() in TRUE_VALUES or x.lower() in FALSE_VALUES)
 
-            # Is it only a date?
-            elif d.time() == NULL_TIME:
-                add(Date)
+        if x is None:
+            return
 
-            # It must be a date and time
-            else:
-                add(TIMESTAMP)
+        if self.is_int:
+            self._add_int(x)
+        if self.is_float:
+            self._add_float(x)
 
-            if 'am' in x.lower():
-                ampm = True
+        if self.is_date:
+            if self.is_int or self.is_float:
+                self.deferred.add(x)
+                if len(self.deferred) > MAX_DEFERRED_DATES:
+                    self._flush_dates()
+            else:
+                self._flush_dates()
+                self._add_date(x)
 
-            if 'pm' in x.lower():
-                ampm = True
+    def _add_int(self, x):
+        try:
+            int_x = int(x.replace(',', ''))
+            # Integers padded with 0s are treated as strings.
+            if x[0] == '0' and int(x) != 0:
+                raise ValueError
+        except ValueError:
+            self.is_int = False
+            return
+
+        if 9000000000000000000 > int_x > 1000000000:
+            self.is_bigint = True
+        elif not 1000000000 > int_x:
+            self.is_int = False
+
+    def _add_float(self, x):
+        try:
+            float(x.replace(',', ''))
+        except ValueError:
+            self.is_float = False
+
+    def _add_date(self, x):
+        # Columns are almost always in one format, so the format of the last
+        # value is tried first.
+        d, date_format = parse_known_format(x, self.date_format)
+        if d is not None:
+            self.date_format = date_format
+        else:
+            try:
+                d = parse(x, default=DEFAULT_DATETIME)
+            # TypeError: https://bugs.launchpad.net/dateutil/+bug/1247643
+            except (ValueError, TypeError, OverflowError):
+                self.is_date = False
+                self.deferred.clear()
+                return
+
+        # Is it only a time?
+        if d.date() == NULL_DATE:
+            self.date_types.add(TIME)
+        # Is it only a date?
+        elif d.time() == NULL_TIME:
+            self.date_types.add(Date)
+        # It must be a date and time
+        else:
+            self.date_types.add(TIMESTAMP)
+
+        if 'am' in x.lower() or 'pm' in x.lower():
+            self.ampm = True
+
+    def _flush_dates(self):
+        deferred, self.deferred = self.deferred, set()
+        for x in deferred:
+            if not self.is_date:
+                break
+            self._add_date(x)
+
+    def result(self):
+        """
+        :return: (col_type, null_values)
+                 where col_type is a SQLAlchemy TypeEngine
+                 and null_values is a boolean
+                 representing whether nulls of any kind were detected.
+        """
+        if self.is_bool:
+            return Boolean, self.null_values
+        if self.is_int:
+            return (BigInteger if self.is_bigint else Integer), self.null_values
+        if self.is_float:
+            return Float, self.null_values
+
+        self._flush_dates()
+        if self.is_date:
+            return self._date_type(), self.null_values
+
+        # Don't know what they are, so they must just be strings
+        return String, self.null_values
+
+    def _date_type(self):
+        types = self.date_types
+        # If a mix of dates and datetimes, up-convert dates to datetimes
+        if types == {TIMESTAMP, Date}:
+            return TIMESTAMP
+        # Anything else mixed, or times written with am/pm,
+        # falls back to using strings
+        if len(types) > 1 or (types == {TIME} and self.ampm):
+            return String
+        return types.pop()
 
-        normal_types_set.discard(NoneType)
 
-        # If a mix of dates and datetimes, up-convert dates to datetimes
-        if normal_types_set == set([TIMESTAMP, Date]):
-            normal_types_set = set([TIMESTAMP])
-        # Datetimes and times don't mix -- fallback to using strings
-        elif normal_types_set == set([TIMESTAMP, TIME]):
-            normal_types_set = set([String])
-        # Dates and times don't mix -- fallback to using strings
-        elif normal_types_set == set([Date, TIME]):
-            normal_types_set = set([String])
-        elif normal_types_set == set([TIME]) and ampm:
-            normal_types_set = set([String])
-
-        return normal_types_set.pop(), null_values
-    except ValueError:
-        pass
-    except TypeError:  # https://bugs.launchpad.net/dateutil/+bug/1247643
-        pass
+def normalize_column_type(l):
+    """Given a sequence of values in a column (l),
+    guess its type.
 
-    # Don't know what they are, so they must just be strings 
-    return String, null_values
+    :param l: A column
+    :return: (col_type, null_values)
+             where col_type is a SQLAlchemy TypeEngine
+             and null_values is a boolean
+             representing whether nulls of any kind were detected.
+    """
+    inference = ColumnTypeInference()
+    for x in l:
+        inference.add(x)
+    return inference.result()
@@ -0,0 +1,156 @@
+import threading
+import time
+import unittest
+
+from flask import Flask
+from werkzeug.datastructures import MultiDict
+
+from plenario.api.caching import SingleFlightCache, TieredRedisCache
+from plenario.settings import REDIS_HOST
+from plenario.api.common import boolean_args, query_fingerprint, referenced_datasets, schema_defaults
+from plenario.api.validator import DatasetRequiredValidator
+
+
+class TestQueryFingerprint(unittest.TestCase):
+
+    def test_argument_order_does_not_matter(self):
+        a = MultiDict([('dataset_name', 'crimes'), ('obs_date__ge', '2016-01-01')])
+        b = MultiDict([('obs_date__ge', '2016-01-01'), ('dataset_name', 'crimes')])
+        self.assertEqual(query_fingerprint(a), query_fingerprint(b))
+
+    def test_equivalent_dates_match(self):
+        a = MultiDict([('obs_date__ge', '2016-01-01')])
+        b = MultiDict([('obs_date__ge', '2016-01-01T00:00:00')])
+        self.assertEqual(query_fingerprint(a), query_fingerprint(b))
+
+    def test_filter_key_order_does_not_matter(self):
+        a = MultiDict([('crimes__filter', '{"op": "eq", "col": "beat", "val": "1"}')])
+        b = MultiDict([('crimes__filter', '{"val": "1", "col": "beat",  "op": "eq"}')])
+        self.assertEqual(query_fingerprint(a), query_fingerprint(b))
+
+    def test_explicit_default_matches_omitted_default(self):
+        defaults = schema_defaults(DatasetRequiredValidator)
+        a = MultiDict([('dataset_name', 'crimes')])
+        b = MultiDict([('dataset_name', 'crimes'), ('offset', '0')])
+        self.assertEqual(query_fingerprint(a, defaults), query_fingerprint(b, defaults))
+
+    def test_different_queries_differ(self):
+        a = MultiDict([('dataset_name', 'crimes')])
+        b = MultiDict([('dataset_name', 'permits')])
+        self.assertNotEqual(query_fingerprint(a), query_fingerprint(b))
+
+    def test_boolean_case_does_not_matter(self):
+        booleans = boolean_args(DatasetRequiredValidator)
+        a = MultiDict([('dataset_name', 'crimes'), ('job', 'True')])
+        b = MultiDict([('dataset_name', 'crimes'), ('job', 'true')])
+        self.assertEqual(query_fingerprint(a, booleans=booleans), query_fingerprint(b, booleans=booleans))
+
+    def test_free_form_values_are_kept(self):
+        booleans = boolean_args(DatasetRequiredValidator)
+        a = MultiDict([('dataset_name', 'crimes'), ('description', 'True')])
+        b = MultiDict([('dataset_name', 'crimes'), ('description', 'true')])
+        c = MultiDict([('dataset_name', 'crimes'), ('description', ' true ')])
+        self.assertNotEqual(query_fingerprint(a, booleans=booleans), query_fingerprint(b, booleans=booleans))
+        self.assertNotEqual(query_fingerprint(b, booleans=booleans), query_fingerprint(c, booleans=booleans))
+
+
+class TestReferencedDatasets(unittest.TestCase):
+
+    def test_collects_every_named_dataset(self):
+        args = MultiDict([
+            ('dataset_name__in', 'crimes, permits'),
+            ('shape', 'boundaries_neighborhoods'),
+            ('landmarks__filter', '{"op": "eq", "col": "name", "val": "x"}')
+        ])
+        self.assertEqual(
+            referenced_datasets(args),
+            {'crimes', 'permits', 'boundaries_neighborhoods', 'landmarks'}
+        )
+
+    def test_no_datasets(self):
+        self.assertEqual(referenced_datasets(MultiDict([('agg', 'week')])), set())
+
+
+class TestSingleFlightCache(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.cache = SingleFlightCache(self.app, config={'CACHE_TYPE': 'simple'})
+        self.calls = []
+
+        @self.cache.cached(timeout=60, key_prefix=lambda: 'key')
+        def view():
+            self.calls.append(1)
+            return 'computed'
+
+        self.view = view
+
+    def test_miss_computes_and_caches(self):
+        with self.app.test_request_context('/'):
+            self.assertEqual(self.view(), 'computed')
+            self.assertEqual(self.view(), 'computed')
+        self.assertEqual(len(self.calls), 1)
+
+    def test_waits_for_request_in_flight(self):
+        backend = self.cache.cache
+        # Another request holds the lock and caches its response shortly.
+        backend.add('flight_key', 'other', timeout=5)
+        threading.Timer(0.1, backend.set, ('key', 'cached by other')).start()
+
+        with self.app.test_request_context('/'):
+            self.assertEqual(self.view(), 'cached by other')
+        self.assertEqual(self.calls, [])
+
+    def test_computes_when_request_in_flight_caches_nothing(self):
+        backend = self.cache.cache
+        # Another request holds the lock and finishes without caching.
+        backend.add('flight_key', 'other', timeout=5)
+        threading.Timer(0.1, backend.delete, ('flight_key',)).start()
+
+        started = time.monotonic()
+        with self.app.test_request_context('/'):
+            self.assertEqual(self.view(), 'computed')
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(len(self.calls), 1)
+
+
+class TestTieredRedisCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TieredRedisCache(host=REDIS_HOST, key_prefix='tiered_test_',
+                                      local_max_size=100, compress_min_size=100, max_size=10000)
+
+    def tearDown(self):
+        self.cache.clear()
+
+    def test_large_entries_are_compressed(self):
+        value = 'x' * 5000
+        self.cache.set('large', value)
+        self.assertTrue(self.cache._client.get('tiered_test_large').startswith(b'z'))
+        self.assertEqual(self.cache.get('large'), value)
+
+    def test_oversized_entries_are_not_cached(self):
+        self.assertFalse(self.cache.set('huge', bytes(range(256)) * 100))
+        self.assertIsNone(self.cache.get('huge'))
+
+    def test_small_entries_are_served_from_memory(self):
+        self.cache.set('small', 'value')
+        self.cache._client.delete('tiered_test_small')
+        self.assertEqual(self.cache.get('small'), 'value')
+
+        self.cache.delete('small')
+        self.assertIsNone(self.cache.get('small'))
+
+    def test_flight_lock_expires(self):
+        app = Flask(__name__)
+        flight = SingleFlightCache(app, config={
+            'CACHE_TYPE': 'plenario.api.caching.tiered_redis',
+            'CACHE_REDIS_HOST': REDIS_HOST,
+            'CACHE_KEY_PREFIX': 'tiered_test_'
+        })
+        self.assertTrue(flight._acquire('flight_key', 'token'))
+        self.assertFalse(flight._acquire('flight_key', 'other'))
+        self.assertGreater(flight.cache._client.ttl('tiered_test_flight_key'), 0)
+
+        flight._release('flight_key', 'token')
+        self.assertFalse(flight._locked('flight_key'))
@@ -0,0 +1,99 @@
+import unittest
+
+from sqlalchemy import Column, Integer, MetaData, String, Table
+
+from plenario.api.condition_builder import _templates, normalize_tree, parse_tree
+
+
+def make_table():
+    return Table('condition_test', MetaData(),
+                 Column('beat', String),
+                 Column('count', Integer))
+
+
+class TestConditionTemplates(unittest.TestCase):
+
+    def test_same_shape_shares_template(self):
+        table = make_table()
+        a = parse_tree(table, {'op': 'and', 'val': [
+            {'op': 'eq', 'col': 'beat', 'val': '1'},
+            {'op': 'ge', 'col': 'count', 'val': 5}
+        ]})
+        b = parse_tree(table, {'op': 'and', 'val': [
+            {'op': 'eq', 'col': 'beat', 'val': '2'},
+            {'op': 'ge', 'col': 'count', 'val': 10}
+        ]})
+
+        self.assertEqual(len(_templates[table]), 1)
+        self.assertEqual(str(a), str(b))
+        self.assertEqual(sorted(a.compile().params.values(), key=str), [5, '1'])
+        self.assertEqual(sorted(b.compile().params.values(), key=str), [10, '2'])
+
+    def test_in_lists_of_different_lengths(self):
+        table = make_table()
+        a = parse_tree(table, {'op': 'in', 'col': 'beat', 'val': '1,2'})
+        b = parse_tree(table, {'op': 'in', 'col': 'beat', 'val': '1,2,3'})
+
+        self.assertEqual(len(_templates[table]), 2)
+        self.assertEqual(sorted(a.compile().params.values()), ['1', '2'])
+        self.assertEqual(sorted(b.compile().params.values()), ['1', '2', '3'])
+
+    def test_null_comparisons_are_not_templated(self):
+        table = make_table()
+        condition = parse_tree(table, {'op': 'eq', 'col': 'beat', 'val': None})
+
+        self.assertNotIn(table, _templates)
+        self.assertIn('IS NULL', str(condition))
+
+
+class TestNormalizeTree(unittest.TestCase):
+
+    def test_flattens_nested_ands(self):
+        tree = {'op': 'and', 'val': [
+            {'op': 'and', 'val': [{'op': 'eq', 'col': 'beat', 'val': '1'}]},
+            {'op': 'and', 'val': [{'op': 'gt', 'col': 'count', 'val': 2}]}
+        ]}
+        self.assertEqual(normalize_tree(tree), {'op': 'and', 'val': [
+            {'op': 'eq', 'col': 'beat', 'val': '1'},
+            {'op': 'gt', 'col': 'count', 'val': 2}
+        ]})
+
+    def test_merges_range_into_between(self):
+        tree = {'op': 'and', 'val': [
+            {'op': 'le', 'col': 'count', 'val': 10},
+            {'op': 'ge', 'col': 'count', 'val': 5}
+        ]}
+        self.assertEqual(normalize_tree(tree), {'op': 'between', 'col': 'count', 'val': [5, 10]})
+
+    def test_folds_equalities_into_in(self):
+        tree = {'op': 'or', 'val': [
+            {'op': 'eq', 'col': 'beat', 'val': '2'},
+            {'op': 'eq', 'col': 'beat', 'val': '1'},
+            {'op': 'in', 'col': 'beat', 'val': '3,1'}
+        ]}
+        self.assertEqual(normalize_tree(tree), {'op': 'in', 'col': 'beat', 'val': ['1', '2', '3']})
+
+    def test_drops_duplicates_and_empty_nodes(self):
+        leaf = {'op': 'eq', 'col': 'beat', 'val': '1'}
+        tree = {'op': 'and', 'val': [leaf, {'op': 'and', 'val': []}, dict(leaf)]}
+        self.assertEqual(normalize_tree(tree), leaf)
+
+    def test_empty_node_under_or_is_dropped(self):
+        leaf = {'op': 'eq', 'col': 'beat', 'val': '1'}
+        tree = {'op': 'or', 'val': [{'op': 'and', 'val': []}, leaf]}
+        self.assertEqual(normalize_tree(tree), leaf)
+
+    def test_child_order_does_not_matter(self):
+        a = {'op': 'and', 'val': [
+            {'op': 'eq', 'col': 'beat', 'val': '1'},
+            {'op': 'gt', 'col': 'count', 'val': 2}
+        ]}
+        b = {'op': 'and', 'val': list(reversed(a['val']))}
+        self.assertEqual(normalize_tree(a), normalize_tree(b))
+
+    def test_between_builds_condition(self):
+        condition = parse_tree(make_table(), {'op': 'and', 'val': [
+            {'op': 'ge', 'col': 'count', 'val': 5},
+            {'op': 'le', 'col': 'count', 'val': 10}
+        ]})
+        self.assertIn('BETWEEN', str(condition))
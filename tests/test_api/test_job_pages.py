@@ -0,0 +1,50 @@
+import gzip
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import uuid
+from unittest import mock
+
+from plenario.api.jobs import _job_dir, _page_path, _write_pages, _write_status, prune_jobs
+
+
+class TestJobPages(unittest.TestCase):
+
+    def setUp(self):
+        self.jobs_dir = tempfile.mkdtemp()
+        patcher = mock.patch('plenario.api.jobs.JOBS_DIR', self.jobs_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.jobs_dir, True)
+
+    def test_pages_split_on_newlines(self):
+        ticket = uuid.uuid4().hex
+        _write_status(ticket, {'ticket': ticket, 'status': 'running'})
+
+        rows = [b'a,b\n', b'1,2\n', b'3,4\n']
+        pages = _write_pages(ticket, rows, page_size=6)
+
+        written = []
+        for page in range(pages):
+            with gzip.open(_page_path(ticket, page), 'rb') as fh:
+                written.append(fh.read())
+
+        self.assertEqual(written, rows)
+
+    def test_unknown_tickets_are_rejected(self):
+        with self.assertRaises(KeyError):
+            _job_dir('../../etc')
+
+    def test_prune_removes_expired_jobs(self):
+        old, new = uuid.uuid4().hex, uuid.uuid4().hex
+        _write_status(old, {'ticket': old, 'status': 'success'})
+        _write_status(new, {'ticket': new, 'status': 'success'})
+        long_ago = time.time() - 2 * 24 * 60 * 60
+        os.utime(_job_dir(old), (long_ago, long_ago))
+
+        prune_jobs()
+
+        self.assertFalse(os.path.exists(_job_dir(old)))
+        self.assertTrue(os.path.exists(_job_dir(new)))
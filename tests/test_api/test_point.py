@@ -3,7 +3,20 @@ import os
 import urllib.request, urllib.parse, urllib.error
 from io import StringIO
 import csv
-
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from unittest import mock
+
+from sqlalchemy import func, select
+
+from plenario.api.common import extract_first_geometry_fragment, make_fragment_str
+from plenario.database import export_engine, literal_sql, parallel_copy_to_stream, postgres_engine, \
+    postgres_session
+from plenario.models import MetaTable
+from plenario.tasks import run_job
+from plenario.utils.geom_cache import intersects_geom, store_geom
 from tests.fixtures.base_test import BasePlenarioTest, fixtures_path
 
 # Filters
@@ -225,6 +238,91 @@ class PointAPITests(BasePlenarioTest):
                                   '&location_geom__within=' + multipolygon)
         self.assertEqual(r['meta']['total'], 11)
 
+    def test_detail_cursor_pagination(self):
+        query = 'detail/?dataset_name=flu_shot_clinics&obs_date__ge=2013-01-01&limit=30'
+        first_page = self.get_api_response(query)
+        self.assertEqual(first_page['meta']['total'], 30)
+
+        cursor = first_page['meta']['cursor']
+        self.assertIsNotNone(cursor)
+
+        second_page = self.get_api_response(query + '&cursor=' + cursor)
+        self.assertTrue(second_page['meta']['total'] > 0)
+        for row in second_page['objects']:
+            self.assertNotIn(row, first_page['objects'])
+
+        everything = self.get_api_response(query.replace('limit=30', 'limit=10000'))
+        self.assertEqual(everything['objects'][30:60], second_page['objects'])
+
+    def test_detail_geojson_cursor_pagination(self):
+        query = 'detail/?dataset_name=flu_shot_clinics&obs_date__ge=2013-01-01&limit=30&data_type=geojson'
+        first_page = self.get_api_response(query)
+        self.assertEqual(len(first_page['features']), 30)
+
+        cursor = first_page['meta']['cursor']
+        self.assertIsNotNone(cursor)
+
+        second_page = self.get_api_response(query + '&cursor=' + cursor)
+        everything = self.get_api_response(query.replace('limit=30', 'limit=10000'))
+        self.assertEqual(everything['features'][30:60], second_page['features'])
+
+    def test_detail_without_cursor(self):
+        query = 'detail/?dataset_name=flu_shot_clinics&obs_date__ge=2013-01-01'
+        resp = self.app.get('/v1/api/' + query)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.data.decode('utf-8'))['meta']['total'], 65)
+
+    def test_detail_bad_cursor(self):
+        query = 'detail/?dataset_name=flu_shot_clinics&cursor=notacursor'
+        resp = self.app.get('/v1/api/' + query)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_datadump_csv(self):
+        query = 'datadump?dataset_name=flu_shot_clinics&obs_date__ge=2013-01-01&data_type=csv'
+        resp = self.app.get('/v1/api/' + query)
+        rows = list(csv.reader(StringIO(resp.data.decode('utf-8'))))
+
+        detail = self.get_api_response('detail?dataset_name=flu_shot_clinics&obs_date__ge=2013-01-01')
+        self.assertEqual(len(rows) - 1, detail['meta']['total'])
+        self.assertNotIn('geom', rows[0])
+        self.assertNotIn('hash', rows[0])
+        self.assertTrue(all(len(row) == len(rows[0]) for row in rows))
+
+    def test_datadump_csv_parallel(self):
+        query = 'datadump?dataset_name=flu_shot_clinics&obs_date__ge=2013-01-01&obs_date__le=2014-01-01&data_type=csv'
+        sequential = self.app.get('/v1/api/' + query).data.decode('utf-8')
+        parallel = self.app.get('/v1/api/' + query + '&parallel=3').data.decode('utf-8')
+
+        sequential = list(csv.reader(StringIO(sequential)))
+        parallel = list(csv.reader(StringIO(parallel)))
+        self.assertEqual(sequential[0], parallel[0])
+        self.assertEqual(sorted(sequential[1:]), sorted(parallel[1:]))
+
+    def test_parallel_copy_cancelled_when_reader_leaves(self):
+        statements = ['COPY (SELECT 1) TO STDOUT', 'COPY (SELECT pg_sleep(60)) TO STDOUT']
+        started = time.monotonic()
+        stream = parallel_copy_to_stream(statements)
+        self.assertEqual(next(stream), b'1\n')
+        stream.close()
+
+        # The sleeping COPY is cancelled and its connection goes back to the
+        # pool well before it would have finished.
+        while export_engine.pool.checkedout() and time.monotonic() - started < 30:
+            time.sleep(0.1)
+        self.assertEqual(export_engine.pool.checkedout(), 0)
+        self.assertLess(time.monotonic() - started, 30)
+
+    def test_datadump_geojson(self):
+        query = 'datadump?dataset_name=flu_shot_clinics&obs_date__ge=2013-01-01&data_type=json'
+        resp = self.app.get('/v1/api/' + query)
+        collection = json.loads(resp.data.decode('utf-8'))
+
+        detail = self.get_api_response('detail?dataset_name=flu_shot_clinics&obs_date__ge=2013-01-01')
+        self.assertEqual(collection['type'], 'FeatureCollection')
+        self.assertEqual(len(collection['features']), detail['meta']['total'])
+        self.assertEqual(collection['features'][0]['geometry']['type'], 'Point')
+        self.assertNotIn('hash', collection['features'][0]['properties'])
+
     # ==================
     # /grid tree filters
     # ==================
@@ -263,6 +361,18 @@ class PointAPITests(BasePlenarioTest):
         # And they were far enough apart to each get their own square.
         self.assertEqual(len(r['features']), 6)
 
+    def test_grid_pyramid_matches_raw_grid(self):
+        meta = MetaTable.get_by_dataset_name('flu_shot_clinics')
+        size_x, size_y = postgres_session.query(meta.grid_table.c.size_x, meta.grid_table.c.size_y) \
+            .filter(meta.grid_table.c.resolution == 500) \
+            .first()
+        obs_dates = {'lower': datetime(2013, 9, 22, 12), 'upper': datetime(2013, 11, 1, 6)}
+
+        pyramid = postgres_session.execute(meta._pyramid_cells(500, size_x, size_y, obs_dates))
+        raw = postgres_session.execute(meta._raw_cells(size_x, size_y, obs_dates=obs_dates))
+
+        self.assertEqual(sorted(tuple(r) for r in pyramid), sorted(tuple(r) for r in raw))
+
     # ===========
     # /timeseries
     # ===========
@@ -351,6 +461,19 @@ class PointAPITests(BasePlenarioTest):
         counts = [time_unit['count'] for time_unit in timeseries['items']]
         self.assertEqual([5], counts)
 
+    def test_narrow_candidates(self):
+        names = MetaTable.index()
+        in_range = MetaTable.narrow_candidates(names, datetime(2013, 1, 1), datetime(2013, 12, 31))
+        self.assertIn('flu_shot_clinics', in_range)
+
+        too_late = MetaTable.narrow_candidates(names, datetime(2100, 1, 1), datetime(2100, 12, 31))
+        self.assertEqual(too_late, [])
+
+        # A square off the coast of Africa, nowhere near Chicago.
+        far_away = json.dumps({'type': 'Polygon', 'coordinates': [[[0, 0], [0, 1], [1, 1], [1, 0], [0, 0]]]})
+        elsewhere = MetaTable.narrow_candidates(names, datetime(2013, 1, 1), datetime(2013, 12, 31), far_away)
+        self.assertEqual(elsewhere, [])
+
     def test_timeseries_with_multiple_datasets(self):
         endpoint = 'timeseries'
         query = '?obs_date__ge=2000-08-01&agg=year&dataset_name__in=flu_shot_clinics,landmarks'
@@ -421,6 +544,88 @@ class PointAPITests(BasePlenarioTest):
         observed_counts = [obj['count'] for obj in response_data['objects']]
         self.assertEqual(expected_counts, observed_counts)
 
+    def test_rollup_counts_match_raw_counts(self):
+        meta = MetaTable.get_by_dataset_name('flu_shot_clinics')
+        # Bounds that fall partway through a day on either end.
+        start, end = datetime(2013, 9, 22, 12), datetime(2013, 11, 1, 6)
+
+        rollup = postgres_session.execute(meta._rollup_counts('week', start, end))
+        raw = postgres_session.execute(meta._raw_counts('week', start, end))
+
+        self.assertEqual(
+            sorted((r.time_bucket, r.count) for r in rollup),
+            sorted((r.time_bucket, r.count) for r in raw)
+        )
+
+    def test_cube_counts_match_raw_counts(self):
+        meta = MetaTable.get_by_dataset_name('flu_shot_clinics')
+        start, end = datetime(2013, 9, 22, 12), datetime(2013, 11, 1, 6)
+        # Large enough to cover whole cells as well as cut through others.
+        rect = urllib.parse.unquote(get_loop_rect())
+        geom = make_fragment_str(extract_first_geometry_fragment(rect))
+
+        cube = postgres_session.execute(meta._cube_counts('week', start, end, geom))
+        raw = postgres_session.execute(meta._raw_counts('week', start, end, geom))
+
+        self.assertEqual(
+            sorted((r.time_bucket, r.count) for r in cube),
+            sorted((r.time_bucket, r.count) for r in raw)
+        )
+
+    def test_geom_filter_uses_spatial_index(self):
+        table = MetaTable.get_by_dataset_name('flu_shot_clinics').point_table
+        rect = urllib.parse.unquote(get_loop_rect())
+        geom = make_fragment_str(extract_first_geometry_fragment(rect))
+        store_geom(geom)
+
+        sel = select([func.count()]).select_from(table).where(intersects_geom(table.c.geom, geom))
+        # The fixture is small enough that a sequential scan would win on
+        # cost, the point is that the filter leaves the index usable at all.
+        with postgres_engine.begin() as connection:
+            connection.execute('SET LOCAL enable_seqscan = off')
+            plan = '\n'.join(row[0] for row in connection.execute('EXPLAIN ' + literal_sql(sel)))
+
+        self.assertIn('idx_flu_shot_clinics_geom', plan)
+
+    def test_expensive_query_is_rejected(self):
+        config = self.app.application.config
+        config['QUERY_COST_LIMIT'], config['QUERY_COST_ACTION'] = 0.01, 'reject'
+        try:
+            resp = self.app.get('/v1/api/detail-aggregate/?dataset_name=flu_shot_clinics'
+                                '&obs_date__ge=2013-01-01&obs_date__le=2014-01-01&event_type=Church')
+        finally:
+            config['QUERY_COST_LIMIT'], config['QUERY_COST_ACTION'] = 0, 'job'
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('job=true', json.loads(resp.data.decode('utf-8'))['meta']['message'])
+
+    def test_expensive_query_becomes_job(self):
+        query = '/v1/api/detail/?dataset_name=flu_shot_clinics&obs_date__ge=2013-01-01&obs_date__le=2014-01-01'
+        config = self.app.application.config
+        config['QUERY_COST_LIMIT'] = 0.01
+        jobs_dir = tempfile.mkdtemp()
+        try:
+            with mock.patch('plenario.api.jobs.JOBS_DIR', jobs_dir), \
+                    mock.patch('plenario.tasks.run_job.apply_async',
+                               side_effect=lambda args, task_id: run_job(*args)):
+                resp = self.app.get(query)
+                ticket = json.loads(resp.data.decode('utf-8'))['ticket']
+                status = json.loads(self.app.get('/v1/api/jobs/' + ticket).data.decode('utf-8'))
+                page = json.loads(self.app.get('/v1/api/jobs/{}?page=0'.format(ticket)).data.decode('utf-8'))
+        finally:
+            config['QUERY_COST_LIMIT'] = 0
+            shutil.rmtree(jobs_dir, ignore_errors=True)
+
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(status['status'], 'success')
+        self.assertEqual(status['pages'], 1)
+
+        # Neither the ticket nor the job's replay of the request was answered
+        # from the cache, the page holds the real response.
+        inline = self.app.get(query)
+        self.assertEqual(inline.status_code, 200)
+        self.assertEqual(page, json.loads(inline.data.decode('utf-8')))
+
     def test_polygon_filter(self):
         query = '/v1/api/detail/?dataset_name=flu_shot_clinics' \
                 '&obs_date__ge=2013-09-22&obs_date__le=2013-10-1' \
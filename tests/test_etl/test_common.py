@@ -0,0 +1,101 @@
+import threading
+from hashlib import md5
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import StringIO
+from unittest import TestCase
+
+from plenario.etl.common import ETLFile, HashingReader, SourceUnchanged, SourceVersion
+
+
+class StubSource(BaseHTTPRequestHandler):
+    """Serves body, honoring If-None-Match only when validators is set."""
+    body = b'a,b\n1,2\n'
+    validators = True
+
+    def do_GET(self):
+        etag = '"{}"'.format(md5(self.body).hexdigest())
+        if self.validators and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        if self.validators:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestConditionalDownload(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('127.0.0.1', 0), StubSource)
+        cls.url = 'http://127.0.0.1:{}/source.csv'.format(cls.server.server_port)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubSource.body = b'a,b\n1,2\n'
+        StubSource.validators = True
+
+    def download(self, last_seen=None):
+        with ETLFile(source_url=self.url, last_seen=last_seen) as helper:
+            return helper.handle.read(), helper.version
+
+    def test_records_version(self):
+        body, version = self.download()
+        self.assertEqual(body, StubSource.body)
+        self.assertEqual(version.etag, '"{}"'.format(md5(StubSource.body).hexdigest()))
+        self.assertEqual(version.length, len(StubSource.body))
+        self.assertEqual(version.checksum, md5(StubSource.body).hexdigest())
+
+    def test_not_modified(self):
+        _, version = self.download()
+        with self.assertRaises(SourceUnchanged):
+            self.download(last_seen=version)
+
+    def test_same_contents_without_validators(self):
+        StubSource.validators = False
+        _, version = self.download()
+        self.assertIsNone(version.etag)
+        with self.assertRaises(SourceUnchanged):
+            self.download(last_seen=version)
+
+    def test_changed(self):
+        _, version = self.download()
+        StubSource.body = b'a,b\n1,3\n'
+        body, changed = self.download(last_seen=version)
+        self.assertEqual(body, StubSource.body)
+        self.assertNotEqual(changed.checksum, version.checksum)
+
+    def test_no_last_seen_always_downloads(self):
+        self.download()
+        self.assertEqual(self.download(last_seen=SourceVersion(None, None, None, None))[0], StubSource.body)
+
+
+class TestHashingReader(TestCase):
+
+    def test_hashing_reader(self):
+        reader = HashingReader(StringIO('a,b\n1,"x,y"\n\n1,"x,y"\n2,\n2,""\n'))
+        lines = ''.join(iter(lambda: reader.read(5), '')).splitlines()
+
+        self.assertEqual(lines[0], 'a,b,hash')
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(lines[1], lines[2])
+        self.assertTrue(lines[1].startswith('1,"x,y",'))
+        self.assertNotEqual(lines[1].split(',')[-1], lines[3].split(',')[-1])
+
+        # COPY loads an unquoted empty field as NULL and a quoted one as an
+        # empty string, so the two must come through as they were.
+        self.assertTrue(lines[3].startswith('2,,'))
+        self.assertTrue(lines[4].startswith('2,"",'))
+        self.assertNotEqual(lines[3].split(',')[-1], lines[4].split(',')[-1])
@@ -210,6 +210,51 @@ class StagingTableTests(TestCase):
         bbox = MetaTable.get_by_dataset_name('community_radio_events').bbox
         self.assertIsNotNone(bbox)
 
+    def test_new_table_has_daily_rollup(self):
+        drop_if_exists(self.unloaded_meta.dataset_name)
+
+        etl = PlenarioETL(self.unloaded_meta, source_path=self.radio_path)
+        new_table = etl.add()
+
+        day = sa.func.date_trunc('day', new_table.c.point_date)
+        raw = sa.select([day, sa.func.count()]).where(new_table.c.point_date != None).group_by(day)
+        expected = dict(postgres_engine.execute(raw).fetchall())
+
+        rollup = Table('r_' + self.unloaded_meta.dataset_name, MetaData(), autoload_with=postgres_engine)
+        observed = dict(postgres_engine.execute(sa.select([rollup.c.day, rollup.c['count']])).fetchall())
+        self.assertEqual(observed, expected)
+
+        postgres_session.close()
+        new_table.drop(postgres_engine, checkfirst=True)
+        rollup.drop(postgres_engine, checkfirst=True)
+
+    def test_update_keeps_rollup_in_step(self):
+        drop_if_exists(self.unloaded_meta.dataset_name)
+
+        etl = PlenarioETL(self.unloaded_meta, source_path=self.radio_path)
+        table = etl.add()
+        postgres_engine.execute(table.update().where(table.c.event_name == 'foo').values(lat=0))
+
+        # Rows that are unchanged in the source are left where they are.
+        changed_path = os.path.join(fixtures_path, 'community_radio_events_changed.csv')
+        etl = PlenarioETL(self.unloaded_meta, source_path=changed_path)
+        etl.update()
+
+        rows = postgres_engine.execute(sa.select([table.c.event_name, table.c.lat])).fetchall()
+        self.assertEqual(len(rows), 5)
+        self.assertIn(('foo', 0), rows)
+
+        day = sa.func.date_trunc('day', table.c.point_date)
+        raw = sa.select([day, sa.func.count()]).where(table.c.point_date != None).group_by(day)
+        expected = dict(postgres_engine.execute(raw).fetchall())
+
+        rollup = Table('r_' + self.unloaded_meta.dataset_name, MetaData(), autoload_with=postgres_engine)
+        observed = dict(postgres_engine.execute(sa.select([rollup.c.day, rollup.c['count']])).fetchall())
+        self.assertEqual(observed, expected)
+
+        postgres_session.close()
+        table.drop(postgres_engine, checkfirst=True)
+
     def test_new_table_has_correct_column_names_in_meta(self):
         drop_if_exists(self.unloaded_meta.dataset_name)
 
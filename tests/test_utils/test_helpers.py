@@ -6,3 +6,66 @@ class TestHelpers(unittest.TestCase):
     def test_slugify(self):
         from plenario.utils.helpers import slugify
         self.assertEqual(slugify("A-Awef-Basdf-123"), "a_awef_basdf_123")
+
+    def test_table_registry_reflects_once_per_version(self):
+        from sqlalchemy import Column, Integer, MetaData, Table
+        from plenario.database import postgres_engine
+        from plenario.utils.helpers import TableRegistry
+
+        table = Table('registry_test', MetaData(), Column('a', Integer))
+        table.drop(postgres_engine, checkfirst=True)
+        table.create(postgres_engine)
+
+        registry = TableRegistry(MetaData(), postgres_engine)
+        first = registry.get('registry_test', version=1)
+        self.assertIs(registry.get('registry_test', version=1), first)
+
+        # Changing the table and the version gets a fresh reflection.
+        postgres_engine.execute('alter table registry_test add column b integer')
+        second = registry.get('registry_test', version=2)
+        self.assertIsNot(second, first)
+        self.assertIn('b', second.c)
+
+        self.assertIsNone(registry.get('registry_test_missing', optional=True))
+        table.drop(postgres_engine)
+
+    def test_first_dataset_version_is_kept(self):
+        from plenario.utils.cache_versions import _versions, dataset_versions
+
+        _versions.delete('version_test')
+        first = dataset_versions(['version_test'])
+        second = dataset_versions(['version_test'])
+        self.assertIsNotNone(first[0][1])
+        self.assertEqual(first, second)
+        _versions.delete('version_test')
+
+    def test_geom_pieces_are_stored_once_per_geometry(self):
+        from sqlalchemy import func, select
+        from plenario.database import postgres_engine
+        from plenario.utils.geom_cache import geom_digest, geom_pieces, store_geom
+
+        square = '{"type": "Polygon", "coordinates": [[[0, 0], [0, 1], [1, 1], [1, 0], [0, 0]]],' \
+                 ' "crs": {"type": "name", "properties": {"name": "EPSG:4326"}}}'
+        respelled = '{"crs": {"properties": {"name": "EPSG:4326"}, "type": "name"},' \
+                    ' "coordinates": [[[0, 0], [0, 1], [1, 1], [1, 0], [0, 0]]], "type": "Polygon"}'
+        self.assertEqual(geom_digest(square), geom_digest(respelled))
+
+        digest = store_geom(square)
+        store_geom(respelled)
+        count = select([func.count()]).where(geom_pieces.c.digest == digest)
+        self.assertEqual(postgres_engine.execute(count).scalar(), 1)
+
+    def test_unused_geom_pieces_are_pruned(self):
+        from sqlalchemy import func, select
+        from plenario.database import postgres_engine
+        from plenario.utils.geom_cache import geom_pieces, prune_geoms, store_geom
+
+        square = '{"type": "Polygon", "coordinates": [[[2, 2], [2, 3], [3, 3], [3, 2], [2, 2]]],' \
+                 ' "crs": {"type": "name", "properties": {"name": "EPSG:4326"}}}'
+        digest = store_geom(square)
+        count = select([func.count()]).where(geom_pieces.c.digest == digest)
+
+        prune_geoms()
+        self.assertEqual(postgres_engine.execute(count).scalar(), 1)
+        prune_geoms(ttl=-60)
+        self.assertEqual(postgres_engine.execute(count).scalar(), 0)
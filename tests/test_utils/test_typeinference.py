@@ -0,0 +1,94 @@
+import unittest
+from io import StringIO
+
+from sqlalchemy import BigInteger, Boolean, Date, Float, Integer, String
+from sqlalchemy.dialects.postgresql import TIME, TIMESTAMP
+
+from plenario.utils import typeinference
+from plenario.utils.helpers import infer_csv_columns
+from dateutil.parser import parse
+
+from plenario.utils.typeinference import DEFAULT_DATETIME, ColumnTypeInference, normalize_column_type, \
+    parse_known_format
+
+
+class TestTypeInference(unittest.TestCase):
+
+    def assertInferred(self, values, expected):
+        self.assertEqual(normalize_column_type(list(values)), expected)
+        self.assertEqual(normalize_column_type(list(reversed(values))), expected)
+
+    def test_types(self):
+        self.assertInferred(['yes', 'F', 'true'], (Boolean, False))
+        self.assertInferred(['1', '2,000', '-3'], (Integer, False))
+        self.assertInferred(['1', '2', '3000000000'], (BigInteger, False))
+        self.assertInferred(['1', '2.5', 'NA'], (Float, True))
+        self.assertInferred(['2016-01-01', '2016-01-02'], (Date, False))
+        self.assertInferred(['2016-01-01', '2016-01-02 10:15'], (TIMESTAMP, False))
+        self.assertInferred(['10:15', '11:30:05'], (TIME, False))
+        self.assertInferred(['hello', '1'], (String, False))
+
+    def test_mixed_dates_and_times_are_strings(self):
+        self.assertInferred(['2016-01-01', '10:15'], (String, False))
+        self.assertInferred(['2016-01-01 10:15', '10:15'], (String, False))
+        self.assertInferred(['10:15 AM', '11:30 PM'], (String, False))
+
+    def test_nulls(self):
+        self.assertInferred([], (Boolean, False))
+        self.assertInferred(['', 'null'], (Integer, True))
+        self.assertInferred(['1', ''], (Integer, True))
+        # Padded with 0s, so not an integer, but still a number.
+        self.assertInferred(['007', '1'], (Float, False))
+
+    def test_deferred_numbers_still_count_as_dates(self):
+        self.assertInferred(['20160101', '2016-01-02'], (Date, False))
+        self.assertInferred(['20160101', '10:15'], (String, False))
+
+    def test_deferred_numbers_are_bounded(self):
+        numbers = [str(n) for n in range(typeinference.MAX_DEFERRED_DATES + 10)]
+
+        inference = ColumnTypeInference()
+        for x in numbers:
+            inference.add(x)
+            self.assertLessEqual(len(inference.deferred), typeinference.MAX_DEFERRED_DATES)
+        inference.add('hello')
+
+        self.assertEqual(inference.result(), (String, False))
+        self.assertFalse(inference.deferred)
+
+    def test_known_formats_parse_like_dateutil(self):
+        values = ['2016-01-31', '2016-1-5', '2016-01-31 13:45', '2016-01-31T13:45:00',
+                  '2016-01-31T13:45:00.000', '2016-01-31T00:00:00.250',
+                  '01/31/2016', '1/5/2016 13:45:00', '01/31/2016 01:45:00 PM',
+                  '01/31/2016 12:00:00 AM', '1/31/2016 12:30 pm', '13:45', '7:05:30', '1:45PM']
+        for x in values:
+            d, date_format = parse_known_format(x)
+            self.assertIsNotNone(date_format, x)
+            self.assertEqual(d, parse(x, default=DEFAULT_DATETIME), x)
+
+    def test_unknown_formats_fall_back_to_dateutil(self):
+        for x in ['31/01/2016', '2016-02-30', 'Jan 31 2016', '2016-01-31T13:45:00Z']:
+            self.assertEqual(parse_known_format(x), (None, None), x)
+
+        self.assertInferred(['01/31/2016', '31/01/2016'], (Date, False))
+        self.assertInferred(['2016-01-31', 'January 5, 2016 1:45 PM'], (TIMESTAMP, False))
+
+
+class TestInferCsvColumns(unittest.TestCase):
+
+    def test_single_pass(self):
+        inp = StringIO('id,when,what\n'
+                       '1,2016-01-01,apple\n'
+                       '2,,banana\n'
+                       '\n'
+                       '3,2016-01-03\n')
+        columns = infer_csv_columns(inp)
+
+        self.assertEqual([c.name for c in columns], ['id', 'when', 'what'])
+        self.assertEqual([c.type_ for c in columns], [Integer, Date, String])
+        self.assertEqual([c.has_nulls for c in columns], [False, True, False])
+
+    def test_sampled_rows(self):
+        inp = StringIO('id\n1\n2\nthree\n')
+        self.assertEqual(infer_csv_columns(inp, max_rows=2)[0].type_, Integer)
+        self.assertEqual(infer_csv_columns(inp)[0].type_, String)